@@ -0,0 +1,72 @@
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.urls import re_path
+from django.utils.cache import get_conditional_response
+from rest_framework.renderers import JSONRenderer
+
+from .cache import count_lookup, response_digest
+from .views import IngredientViewSet, RecipeViewSet, TagViewSet
+
+ASYNC_ROUTES = {
+    'tags-list': (TagViewSet.cache_versions, None, 'tags'),
+    'ingredients-autocomplete': (
+        IngredientViewSet.cache_versions, None, 'ingredients-autocomplete'),
+    'recipes-list': (
+        RecipeViewSet.cache_versions, RecipeViewSet.cache_params,
+        'recipes-list'),
+    'recipes-detail': (RecipeViewSet.cache_versions, (), 'recipes-detail'),
+}
+
+
+def is_anonymous_read(request):
+    return (request.method in ('GET', 'HEAD')
+            and 'HTTP_AUTHORIZATION' not in request.META
+            and 'text/html' not in request.META.get('HTTP_ACCEPT', ''))
+
+
+def cached_hit(request, versions, params, name):
+    digest = response_digest(request, versions, params)
+    etag = f'"{digest}"'
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        data = cache.get(f'response:{digest}')
+        if data is None:
+            return None
+        response = HttpResponse(
+            JSONRenderer().render(data),
+            content_type=JSONRenderer.media_type
+        )
+        response['X-Cache'] = 'HIT'
+        response['Vary'] = 'Accept'
+    count_lookup(name, True)
+    response['ETag'] = etag
+    return response
+
+
+def async_cached(view, versions, params, name):
+    lookup = sync_to_async(cached_hit, thread_sensitive=False)
+    fallback = sync_to_async(view)
+
+    async def async_view(request, *args, **kwargs):
+        if is_anonymous_read(request):
+            response = await lookup(request, versions, params, name)
+            if response is not None:
+                return response
+        return await fallback(request, *args, **kwargs)
+
+    async_view.csrf_exempt = True
+    return async_view
+
+
+def async_urlpatterns(urls):
+    return [
+        re_path(
+            url.pattern.regex.pattern,
+            async_cached(url.callback, *ASYNC_ROUTES[url.name]),
+            name=url.name
+        )
+        for url in urls
+        if url.name in ASYNC_ROUTES
+        and 'format' not in url.pattern.regex.groupindex
+    ]
@@ -0,0 +1,950 @@
+import random
+import statistics
+import struct
+import time
+import tracemalloc
+import zlib
+from base64 import b64encode
+from io import BytesIO, StringIO
+from itertools import count, cycle, product
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.contrib.auth.tokens import default_token_generator
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models import Count, F, Q
+from django.test.utils import CaptureQueriesContext, override_settings
+from djoser.utils import encode_uid
+from drf_base64.fields import Base64ImageField
+from PIL import Image
+from rest_framework.test import APIClient
+
+from api.fields import StreamingBase64ImageField
+
+from foodgram.versions import bump_version
+from recipes.images import get_backend
+from recipes.matching import (INDEX_VERSION, get_ingredient_index,
+                              publish_delta)
+from recipes.similarity import rebuild_similar, refresh_similar
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            RecipeTag, ShoppingList, ShoppingListIngredient,
+                            Tag, TimelineEntry)
+from users.models import Subscriptions, User
+
+PASSWORD = 'benchmark-password'
+IMAGE = (
+    'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABAgMAAABieywaAAAA'
+    'CVBMVEUAAAD///9fX1/S0ecCAAAACXBIWXMAAA7EAAAOxAGVKw4bAAAACklEQVQImWNo'
+    'AAAAggCByxOyYQAAAABJRU5ErkJggg=='
+)
+SUITES = {}
+
+
+def suite(name):
+    def register(func):
+        SUITES[name] = func
+        return func
+    return register
+
+
+def seed_dataset(users, recipes, ingredients, recipe_ingredients,
+                 favorites, subscriptions, carts, tags=6, seed=0):
+    rnd = random.Random(seed)
+    User.objects.bulk_create(
+        User(
+            username=f'bench_user_{i}',
+            email=f'bench_user_{i}@foodgram.ru',
+            first_name=f'Имя {i}',
+            last_name=f'Фамилия {i}'
+        )
+        for i in range(users)
+    )
+    user_ids = list(User.objects.filter(
+        username__startswith='bench_user_').values_list('id', flat=True))
+    Tag.objects.bulk_create(
+        Tag(name=f'Тег {i}', slug=f'bench_tag_{i}', color=f'#0000{i:02}')
+        for i in range(tags)
+    )
+    tag_ids = list(Tag.objects.filter(
+        slug__startswith='bench_tag_').values_list('id', flat=True))
+    Ingredient.objects.bulk_create(
+        Ingredient(name=f'Ингредиент {i}', measurement_unit='г')
+        for i in range(ingredients)
+    )
+    ingredient_ids = list(Ingredient.objects.filter(
+        name__startswith='Ингредиент ').values_list('id', flat=True))
+    Recipe.objects.bulk_create(
+        Recipe(
+            author_id=rnd.choice(user_ids),
+            name=f'Рецепт {i}',
+            image='recipes/benchmark.png',
+            text=f'Описание рецепта {i}. ' * 10,
+            cooking_time=rnd.randint(1, 180)
+        )
+        for i in range(recipes)
+    )
+    recipe_ids = list(Recipe.objects.filter(
+        name__startswith='Рецепт ').values_list('id', flat=True))
+    RecipeTag.objects.bulk_create(
+        RecipeTag(recipe_id=recipe_id, tag_id=tag_id)
+        for recipe_id in recipe_ids
+        for tag_id in rnd.sample(tag_ids, rnd.randint(1, 3))
+    )
+    RecipeIngredient.objects.bulk_create(
+        (
+            RecipeIngredient(
+                recipe_id=recipe_id,
+                ingredient_id=ingredient_id,
+                amount=rnd.randint(1, 500)
+            )
+            for recipe_id in recipe_ids
+            for ingredient_id in rnd.sample(
+                ingredient_ids, recipe_ingredients)
+        ),
+        batch_size=5000
+    )
+    Favorite.objects.bulk_create(
+        (
+            Favorite(user_id=user_id, recipe_id=recipe_id)
+            for user_id in user_ids
+            for recipe_id in rnd.sample(recipe_ids, favorites)
+        ),
+        batch_size=5000
+    )
+    Subscriptions.objects.bulk_create(
+        (
+            Subscriptions(user_id=user_id, author_id=author_id)
+            for user_id in user_ids
+            for author_id in rnd.sample(user_ids, subscriptions)
+            if author_id != user_id
+        ),
+        batch_size=5000
+    )
+    ShoppingList.objects.bulk_create(
+        (
+            ShoppingList(user_id=user_id, recipe_id=recipe_id)
+            for user_id in user_ids
+            for recipe_id in rnd.sample(recipe_ids, carts)
+        ),
+        batch_size=5000
+    )
+    ShoppingListIngredient.objects.rebuild()
+    Recipe.objects.reconcile_counters()
+    user = User.objects.get(id=user_ids[0])
+    user.set_password(PASSWORD)
+    user.save()
+    return {
+        'user': user,
+        'recipe_ids': recipe_ids,
+        'user_ids': user_ids,
+        'tag_slugs': list(Tag.objects.filter(
+            id__in=tag_ids).values_list('slug', flat=True)),
+        'ingredient_ids': ingredient_ids,
+    }
+
+
+def response_size(response):
+    if response.streaming:
+        return len(b''.join(response.streaming_content))
+    return len(response.content)
+
+
+def measure(client, method, url, data=None, trace_memory=False):
+    connection.queries_log.clear()
+    if trace_memory:
+        tracemalloc.start()
+    try:
+        with CaptureQueriesContext(connection) as context:
+            start = time.perf_counter()
+            response = getattr(client, method)(url, data, format='json')
+            size = response_size(response)
+            elapsed = time.perf_counter() - start
+        if trace_memory:
+            peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        if trace_memory:
+            tracemalloc.stop()
+        get_backend().wait()
+    result = {
+        'status': response.status_code,
+        'queries': len(context),
+        'time_ms': elapsed * 1000,
+        'bytes': size,
+        'response': response,
+    }
+    if trace_memory:
+        result['peak_kb'] = peak // 1024
+    return result
+
+
+def after_bump(url, name='recipes'):
+    def build(state):
+        bump_version(name)
+        return url
+    return build
+
+
+def run_requests(requests, repeat, trace_memory=False):
+    results = {}
+    for _ in range(repeat):
+        state = {}
+        for name, client, method, url, data in requests:
+            if callable(url):
+                url = url(state)
+            if callable(data):
+                data = data(state)
+            result = measure(client, method, url, data, trace_memory)
+            state[name] = result.pop('response')
+            results.setdefault(name, []).append(result)
+    return {name: summarize(runs) for name, runs in results.items()}
+
+
+def summarize(runs):
+    summary = {
+        'status': runs[-1]['status'],
+        'queries': max(run['queries'] for run in runs),
+        'time_ms': round(
+            statistics.median(run['time_ms'] for run in runs), 2),
+        'bytes': runs[-1]['bytes'],
+    }
+    if 'peak_kb' in runs[-1]:
+        summary['peak_kb'] = max(run['peak_kb'] for run in runs)
+    return summary
+
+
+@suite('endpoints')
+def endpoints_suite(dataset, repeat):
+    user = dataset['user']
+    recipe_id = dataset['recipe_ids'][len(dataset['recipe_ids']) // 2]
+    recipe_author_id = Recipe.objects.get(id=recipe_id).author_id
+    author_id = next(
+        author_id for author_id in reversed(dataset['user_ids'])
+        if not Subscriptions.objects.filter(
+            user=user, author_id=author_id).exists()
+        and author_id != user.id
+    )
+    used_recipe_ids = set(Favorite.objects.filter(
+        user=user).values_list('recipe_id', flat=True)).union(
+        ShoppingList.objects.filter(
+            user=user).values_list('recipe_id', flat=True))
+    free_recipe_ids = [
+        recipe_id for recipe_id in dataset['recipe_ids']
+        if recipe_id not in used_recipe_ids
+    ]
+    free_recipe_id = free_recipe_ids[0]
+    meal_plan = {'recipes': free_recipe_ids[1:8]}
+    tags = '&'.join(f'tags={slug}' for slug in dataset['tag_slugs'][:2])
+    deep_position = sorted(dataset['recipe_ids'], reverse=True)[
+        min(600, len(dataset['recipe_ids']) - 1)]
+    deep_cursor = b64encode(
+        urlencode({'p': deep_position}).encode()).decode()
+    ingredients = [
+        {'id': ingredient_id, 'amount': 10}
+        for ingredient_id in dataset['ingredient_ids'][:30]
+    ]
+    cookable = urlencode(
+        [('ingredients', item['id']) for item in ingredients[:10]])
+    tag_ids = list(Tag.objects.filter(
+        slug__in=dataset['tag_slugs'][:2]).values_list('id', flat=True))
+    new_user = count()
+    account = User.objects.create_user(
+        username='bench_account',
+        email='bench_account@foodgram.ru',
+        password=PASSWORD
+    )
+    profile = {
+        'email': user.email,
+        'username': user.username,
+        'first_name': user.first_name,
+        'last_name': user.last_name,
+    }
+
+    def registration(number):
+        return {
+            'email': f'bench_new_{number}@foodgram.ru',
+            'username': f'bench_new_{number}',
+            'first_name': 'Имя',
+            'last_name': 'Фамилия',
+            'password': PASSWORD,
+        }
+
+    def confirmation(fields=dict, deactivate=False):
+        def build(state):
+            if deactivate:
+                User.objects.filter(id=account.id).update(is_active=False)
+            account.refresh_from_db()
+            return dict(
+                fields(),
+                uid=encode_uid(account.pk),
+                token=default_token_generator.make_token(account)
+            )
+        return build
+
+    def disposable(url):
+        def build(state):
+            number = next(new_user)
+            doomed_user = User.objects.create_user(
+                username=f'bench_doomed_{number}',
+                email=f'bench_doomed_{number}@foodgram.ru',
+                password=PASSWORD
+            )
+            doomed.force_authenticate(doomed_user)
+            return url.format(id=doomed_user.id)
+        return build
+
+    anon = APIClient()
+    auth = APIClient()
+    auth.force_authenticate(user)
+    doomed = APIClient()
+    created_recipe = '/api/recipes/{}/'.format
+    requests = [
+        ('users-list', anon, 'get', '/api/users/', None),
+        ('users-list-auth', auth, 'get', '/api/users/', None),
+        ('users-detail', auth, 'get', f'/api/users/{author_id}/', None),
+        ('users-me', auth, 'get', '/api/users/me/', None),
+        ('users-create', anon, 'post', '/api/users/',
+         lambda state: registration(next(new_user))),
+        ('users-set-password', auth, 'post', '/api/users/set_password/', {
+            'current_password': PASSWORD,
+            'new_password': PASSWORD + '-new',
+        }),
+        ('users-set-password-back', auth, 'post',
+         '/api/users/set_password/', {
+             'current_password': PASSWORD + '-new',
+             'new_password': PASSWORD,
+         }),
+        ('token-login', anon, 'post', '/api/auth/token/login/', {
+            'email': user.email,
+            'password': PASSWORD,
+        }),
+        ('token-logout', auth, 'post', '/api/auth/token/logout/', None),
+        ('users-me-patch', auth, 'patch', '/api/users/me/',
+         {'first_name': 'Новое имя'}),
+        ('users-me-put', auth, 'put', '/api/users/me/', profile),
+        ('users-detail-patch', auth, 'patch', f'/api/users/{user.id}/',
+         {'last_name': 'Новая фамилия'}),
+        ('users-detail-put', auth, 'put', f'/api/users/{user.id}/',
+         profile),
+        ('users-reset-password', anon, 'post', '/api/users/reset_password/',
+         {'email': account.email}),
+        ('users-reset-password-confirm', anon, 'post',
+         '/api/users/reset_password_confirm/',
+         confirmation(lambda: {'new_password': PASSWORD})),
+        ('users-reset-username', anon, 'post', '/api/users/reset_username/',
+         {'email': account.email}),
+        ('users-activation', anon, 'post', '/api/users/activation/',
+         confirmation(deactivate=True)),
+        ('users-resend-activation', anon, 'post',
+         '/api/users/resend_activation/', {'email': account.email}),
+        ('users-me-delete', doomed, 'delete',
+         disposable('/api/users/me/'), {'current_password': PASSWORD}),
+        ('users-detail-delete', doomed, 'delete',
+         disposable('/api/users/{id}/'), {'current_password': PASSWORD}),
+        ('users-subscriptions', auth, 'get',
+         '/api/users/subscriptions/?recipes_limit=3', None),
+        ('users-subscriptions-cursor', auth, 'get',
+         '/api/users/subscriptions/?recipes_limit=3&cursor=', None),
+        ('users-subscribe', auth, 'post',
+         f'/api/users/{author_id}/subscribe/?recipes_limit=3', None),
+        ('users-unsubscribe', auth, 'delete',
+         f'/api/users/{author_id}/subscribe/', None),
+        ('api-root', anon, 'get', '/api/', None),
+        ('tags-list', anon, 'get', '/api/tags/', None),
+        ('tags-detail', anon, 'get',
+         f'/api/tags/{tag_ids[0]}/', None),
+        ('ingredients-list', anon, 'get', '/api/ingredients/', None),
+        ('ingredients-search', anon, 'get',
+         '/api/ingredients/?name=Ингредиент 1', None),
+        ('ingredients-detail', anon, 'get',
+         f'/api/ingredients/{dataset["ingredient_ids"][0]}/', None),
+        ('ingredients-autocomplete', anon, 'get',
+         '/api/ingredients/autocomplete/?name=Ингредиент 1', None),
+        ('recipes-list', anon, 'get', '/api/recipes/', None),
+        ('recipes-list-auth', auth, 'get', '/api/recipes/', None),
+        ('recipes-list-deep-page', anon, 'get', '/api/recipes/?page=100',
+         None),
+        ('recipes-list-cursor', anon, 'get', '/api/recipes/?cursor=', None),
+        ('recipes-list-deep-cursor', anon, 'get',
+         f'/api/recipes/?cursor={deep_cursor}', None),
+        ('recipes-list-tags', anon, 'get', f'/api/recipes/?{tags}', None),
+        ('recipes-list-author', anon, 'get',
+         f'/api/recipes/?author={recipe_author_id}', None),
+        ('recipes-list-popular', anon, 'get',
+         '/api/recipes/?ordering=popular', None),
+        ('recipes-list-favorited', auth, 'get',
+         f'/api/recipes/?is_favorited=1&{tags}', None),
+        ('recipes-list-in-cart', auth, 'get',
+         '/api/recipes/?is_in_shopping_cart=1', None),
+        ('recipes-feed', auth, 'get', '/api/recipes/feed/', None),
+        ('recipes-cookable', anon, 'get',
+         f'/api/recipes/cookable/?{cookable}', None),
+        ('recipes-detail', anon, 'get', f'/api/recipes/{recipe_id}/', None),
+        ('recipes-detail-auth', auth, 'get',
+         f'/api/recipes/{recipe_id}/', None),
+        ('recipes-similar', anon, 'get',
+         f'/api/recipes/{recipe_id}/similar/', None),
+        ('recipes-create', auth, 'post', '/api/recipes/', lambda state: {
+            'name': f'Новый рецепт {next(new_user)}',
+            'text': 'Описание',
+            'cooking_time': 10,
+            'image': IMAGE,
+            'tags': tag_ids,
+            'ingredients': ingredients,
+        }),
+        ('recipes-update', auth, 'patch',
+         lambda state: created_recipe(state['recipes-create'].data['id']),
+         lambda state: {
+             'name': f'Изменённый рецепт {next(new_user)}',
+             'text': 'Описание',
+             'cooking_time': 20,
+             'image': IMAGE,
+             'tags': tag_ids[:1],
+             'ingredients': [
+                 dict(item, amount=20) for item in ingredients[:5]
+             ] + ingredients[5:20],
+         }),
+        ('recipes-delete', auth, 'delete',
+         lambda state: created_recipe(state['recipes-create'].data['id']),
+         None),
+        ('recipes-favorite', auth, 'post',
+         f'/api/recipes/{free_recipe_id}/favorite/', None),
+        ('recipes-unfavorite', auth, 'delete',
+         f'/api/recipes/{free_recipe_id}/favorite/', None),
+        ('recipes-cart-add', auth, 'post',
+         f'/api/recipes/{free_recipe_id}/shopping_cart/', None),
+        ('recipes-cart-remove', auth, 'delete',
+         f'/api/recipes/{free_recipe_id}/shopping_cart/', None),
+        ('recipes-bulk-favorite', auth, 'post',
+         '/api/recipes/bulk_favorite/', meal_plan),
+        ('recipes-bulk-unfavorite', auth, 'delete',
+         '/api/recipes/bulk_favorite/', meal_plan),
+        ('recipes-bulk-cart-add', auth, 'post',
+         '/api/recipes/bulk_shopping_cart/', meal_plan),
+        ('recipes-bulk-cart-remove', auth, 'delete',
+         '/api/recipes/bulk_shopping_cart/', meal_plan),
+        ('recipes-download-cart', auth, 'get',
+         '/api/recipes/download_shopping_cart/', None),
+        ('recipes-download-cart-csv', auth, 'get',
+         '/api/recipes/download_shopping_cart/?format=csv', None),
+        ('recipes-download-cart-json', auth, 'get',
+         '/api/recipes/download_shopping_cart/?format=json', None),
+    ]
+    djoser = dict(
+        settings.DJOSER,
+        PASSWORD_RESET_CONFIRM_URL='password/reset/{uid}/{token}',
+        USERNAME_RESET_CONFIRM_URL='username/reset/{uid}/{token}'
+    )
+    with override_settings(DJOSER=djoser):
+        return run_requests(requests, repeat)
+
+
+@suite('autocomplete')
+def autocomplete_suite(dataset, repeat):
+    call_command('uploader', stdout=StringIO())
+    rnd = random.Random(0)
+    names = rnd.sample(list(Ingredient.objects.exclude(
+        id__in=dataset['ingredient_ids']).values_list('name', flat=True)), 20)
+    client = APIClient()
+    requests = []
+    for length in (1, 2, 3, 5):
+        for name in names:
+            prefix = name[:length]
+            requests.append((f'list-{length}-chars', client, 'get',
+                             f'/api/ingredients/?name={prefix}', None))
+            requests.append((f'autocomplete-{length}-chars', client, 'get',
+                             f'/api/ingredients/autocomplete/?name={prefix}',
+                             None))
+    return run_requests(requests, repeat)
+
+
+@suite('recipes-cache')
+def recipes_cache_suite(dataset, repeat):
+    client = APIClient()
+    auth = APIClient()
+    auth.force_authenticate(dataset['user'])
+    tags = '&'.join(f'tags={slug}' for slug in dataset['tag_slugs'][:2])
+    recipe_id = dataset['recipe_ids'][0]
+    requests = []
+    for name, url in (
+        ('list', '/api/recipes/'),
+        ('list-tags', f'/api/recipes/?{tags}'),
+        ('list-page', '/api/recipes/?page=5'),
+        ('detail', f'/api/recipes/{recipe_id}/'),
+    ):
+        requests.append((f'{name}-miss', client, 'get', after_bump(url), None))
+        requests.append((f'{name}-hit', client, 'get', url, None))
+        requests.append((f'{name}-personal-hit', auth, 'get', url, None))
+        requests.append((
+            f'{name}-personal-sets-miss', auth, 'get',
+            after_bump(url, f'user:{dataset["user"].id}:favorites'), None
+        ))
+        requests.append((
+            f'{name}-personal-uncached', auth, 'get',
+            url + ('&' if '?' in url else '?') + 'is_favorited=0', None
+        ))
+    return run_requests(requests, repeat)
+
+
+@suite('filters')
+def filters_suite(dataset, repeat):
+    user = dataset['user']
+    author_id = Recipe.objects.filter(
+        id__in=dataset['recipe_ids']).values_list('author_id', flat=True)[0]
+    client = APIClient()
+    client.force_authenticate(user)
+    requests = []
+    for tags, author, favorited, in_cart in product(
+            (0, 1, 3), (False, True), (False, True), (False, True)):
+        params = [('tags', slug) for slug in dataset['tag_slugs'][:tags]]
+        if author:
+            params.append(('author', author_id))
+        if favorited:
+            params.append(('is_favorited', 1))
+        if in_cart:
+            params.append(('is_in_shopping_cart', 1))
+        name = '-'.join(
+            [f'tags{tags}']
+            + ['author'] * author
+            + ['favorited'] * favorited
+            + ['cart'] * in_cart
+        )
+        requests.append((name, client, 'get',
+                         f'/api/recipes/?{urlencode(params)}', None))
+    return run_requests(requests, repeat)
+
+
+def large_image(width=3000, height=2000):
+    buffer = BytesIO()
+    Image.effect_noise((width, height), 64).convert('RGB').save(
+        buffer, 'JPEG', quality=90)
+    return 'data:image/jpeg;base64,' + b64encode(
+        buffer.getvalue()).decode()
+
+
+@suite('images')
+def images_suite(dataset, repeat):
+    client = APIClient()
+    client.force_authenticate(dataset['user'])
+    image = large_image()
+    tag_ids = list(Tag.objects.filter(
+        slug__in=dataset['tag_slugs'][:1]).values_list('id', flat=True))
+    number = count()
+
+    def payload(state):
+        return {
+            'name': f'Рецепт с большим фото {next(number)}',
+            'text': 'Описание',
+            'cooking_time': 10,
+            'image': image,
+            'tags': tag_ids,
+            'ingredients': [
+                {'id': dataset['ingredient_ids'][0], 'amount': 10}],
+        }
+
+    results = {}
+    for name, backend in (('inline', 'recipes.images.SyncBackend'),
+                          ('background', 'recipes.images.ThreadPoolBackend')):
+        options = dict(settings.RECIPE_IMAGES, BACKEND=backend)
+        with override_settings(RECIPE_IMAGES=options):
+            results.update(run_requests(
+                [(f'recipes-create-large-image-{name}', client, 'post',
+                  '/api/recipes/', payload)],
+                repeat
+            ))
+            get_backend().wait()
+    return results
+
+
+def png_header(width, height):
+    def chunk(kind, data):
+        return (struct.pack('>I', len(data)) + kind + data
+                + struct.pack('>I', zlib.crc32(kind + data)))
+
+    return (b'\x89PNG\r\n\x1a\n'
+            + chunk(b'IHDR', struct.pack(
+                '>IIBBBBB', width, height, 8, 0, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(b''))
+            + chunk(b'IEND', b''))
+
+
+def measure_decode(field, data, repeat):
+    runs = []
+    for _ in range(repeat):
+        tracemalloc.start()
+        try:
+            start = time.perf_counter()
+            field.to_internal_value(data).close()
+            elapsed = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        runs.append({
+            'status': 200,
+            'queries': 0,
+            'time_ms': elapsed * 1000,
+            'bytes': 0,
+            'peak_kb': peak // 1024,
+        })
+    return summarize(runs)
+
+
+@suite('uploads')
+def uploads_suite(dataset, repeat):
+    client = APIClient()
+    client.force_authenticate(dataset['user'])
+    image = large_image()
+    max_bytes = settings.RECIPE_IMAGES['MAX_UPLOAD_BYTES']
+    too_large = 'data:image/jpeg;base64,' + 'A' * (max_bytes // 3 * 4 + 8)
+    huge_body = 'data:image/jpeg;base64,' + 'A' * (
+        settings.RECIPE_IMAGES['MAX_REQUEST_BYTES'] + 8)
+    too_many_pixels = 'data:image/png;base64,' + b64encode(
+        png_header(9000, 9000)).decode()
+    number = count()
+
+    def payload(image):
+        return lambda state: {
+            'name': f'Рецепт с загрузкой {next(number)}',
+            'text': 'Описание',
+            'cooking_time': 10,
+            'image': image,
+            'tags': [],
+            'ingredients': [
+                {'id': dataset['ingredient_ids'][0], 'amount': 10}],
+        }
+
+    results = {
+        'decode-drf-base64': measure_decode(
+            Base64ImageField(), image, repeat),
+        'decode-streaming': measure_decode(
+            StreamingBase64ImageField(), image, repeat),
+    }
+    options = dict(settings.RECIPE_IMAGES,
+                   BACKEND='recipes.images.SyncBackend')
+    with override_settings(RECIPE_IMAGES=options):
+        results.update(run_requests([
+            ('recipes-create-large-image', client, 'post', '/api/recipes/',
+             payload(image)),
+            ('recipes-create-too-large', client, 'post', '/api/recipes/',
+             payload(too_large)),
+            ('recipes-create-huge-body', client, 'post', '/api/recipes/',
+             payload(huge_body)),
+            ('recipes-create-too-many-pixels', client, 'post',
+             '/api/recipes/', payload(too_many_pixels)),
+        ], repeat, trace_memory=True))
+    return results
+
+
+SEARCH_CORPUS = 20000
+SEARCH_WORDS = (
+    'борщ', 'суп', 'салат', 'пирог', 'каша', 'омлет', 'котлеты', 'плов',
+    'рагу', 'запеканка', 'блины', 'оладьи', 'пельмени', 'вареники', 'соус',
+    'картофель', 'морковь', 'свёкла', 'капуста', 'лук', 'чеснок', 'томаты',
+    'огурцы', 'перец', 'курица', 'говядина', 'свинина', 'рыба', 'грибы',
+    'сыр', 'творог', 'сметана', 'молоко', 'яйца', 'мука', 'сахар', 'соль',
+    'масло', 'рис', 'гречка', 'фасоль', 'яблоки', 'тыква', 'укроп',
+    'петрушка', 'запечь', 'обжарить', 'отварить', 'нарезать', 'смешать',
+    'посолить', 'подавать', 'горячим', 'холодным', 'домашний', 'быстрый',
+    'праздничный', 'постный', 'острый', 'нежный',
+)
+SEARCH_QUERIES = {
+    'common-word': 'картофель',
+    'two-words': 'курица грибы',
+    'prefix': 'запек',
+    'name-word': 'борщ',
+    'rare-word': 'трюфель',
+    'no-match': 'ананас',
+}
+
+
+def search_corpus(dataset, size, seed=0):
+    rnd = random.Random(seed)
+    author_ids = dataset['user_ids'][:100]
+    Recipe.objects.bulk_create(
+        (
+            Recipe(
+                author_id=rnd.choice(author_ids),
+                name=f'{" ".join(rnd.sample(SEARCH_WORDS, 3))} {i}',
+                image='recipes/benchmark.png',
+                text=' '.join(
+                    rnd.choices(SEARCH_WORDS, k=rnd.randint(30, 60))
+                    + ['трюфель'] * (i % 1000 == 0)
+                ),
+                cooking_time=rnd.randint(1, 180)
+            )
+            for i in range(size)
+        ),
+        batch_size=5000
+    )
+
+
+def measure_queryset(build, repeat):
+    runs = []
+    for _ in range(repeat):
+        connection.queries_log.clear()
+        with CaptureQueriesContext(connection) as context:
+            start = time.perf_counter()
+            queryset = build()
+            count = queryset.count()
+            list(queryset[:settings.REST_FRAMEWORK['PAGE_SIZE']])
+            elapsed = time.perf_counter() - start
+        runs.append({
+            'status': 200,
+            'queries': len(context),
+            'time_ms': elapsed * 1000,
+            'bytes': count,
+        })
+    return summarize(runs)
+
+
+@suite('search')
+def search_suite(dataset, repeat):
+    client = APIClient()
+    tags = f'tags={dataset["tag_slugs"][0]}'
+    results = {}
+    with transaction.atomic():
+        search_corpus(dataset, SEARCH_CORPUS)
+        for name, query in SEARCH_QUERIES.items():
+            terms = query.split()
+            results[f'icontains-{name}'] = measure_queryset(
+                lambda: Recipe.objects.default_search(terms).order_by(
+                    '-search_rank', '-id'),
+                repeat
+            )
+            results[f'index-{name}'] = measure_queryset(
+                lambda: Recipe.objects.search(query), repeat)
+        requests = []
+        for name, query in SEARCH_QUERIES.items():
+            requests.append((f'recipes-search-{name}', client, 'get',
+                             after_bump(f'/api/recipes/?search={query}'),
+                             None))
+        requests.append((
+            'recipes-search-tags', client, 'get',
+            after_bump(f'/api/recipes/?search=картофель&{tags}'), None))
+        requests.append((
+            'recipes-search-popular', client, 'get',
+            after_bump('/api/recipes/?search=картофель&ordering=popular'),
+            None))
+        results.update(run_requests(requests, repeat))
+        transaction.set_rollback(True)
+    return results
+
+
+COOKABLE_CATALOGUE = 30000
+
+
+def cookable_catalogue(dataset, size, recipe_ingredients, seed=0):
+    rnd = random.Random(seed)
+    author_ids = dataset['user_ids'][:100]
+    Recipe.objects.bulk_create(
+        (
+            Recipe(
+                author_id=rnd.choice(author_ids),
+                name=f'Рецепт из каталога {i}',
+                image='recipes/benchmark.png',
+                text='Описание',
+                cooking_time=rnd.randint(1, 180)
+            )
+            for i in range(size)
+        ),
+        batch_size=5000
+    )
+    recipe_ids = Recipe.objects.filter(
+        name__startswith='Рецепт из каталога ').values_list('id', flat=True)
+    RecipeIngredient.objects.bulk_create(
+        (
+            RecipeIngredient(
+                recipe_id=recipe_id,
+                ingredient_id=ingredient_id,
+                amount=rnd.randint(1, 500)
+            )
+            for recipe_id in recipe_ids.iterator()
+            for ingredient_id in rnd.sample(
+                dataset['ingredient_ids'], recipe_ingredients)
+        ),
+        batch_size=5000
+    )
+
+
+def cookable_sql(ingredients):
+    return Recipe.objects.annotate(
+        total=Count('recipeingredient'),
+        matched=Count('recipeingredient',
+                      filter=Q(recipeingredient__ingredient__in=ingredients))
+    ).filter(matched__gt=0).order_by(
+        F('total') - F('matched'), '-matched', '-id')
+
+
+def measure_index(ingredients, repeat):
+    runs = []
+    for _ in range(repeat):
+        connection.queries_log.clear()
+        with CaptureQueriesContext(connection) as context:
+            start = time.perf_counter()
+            ranked = get_ingredient_index().match(ingredients)
+            elapsed = time.perf_counter() - start
+        runs.append({
+            'status': 200,
+            'queries': len(context),
+            'time_ms': elapsed * 1000,
+            'bytes': len(ranked),
+        })
+    return summarize(runs)
+
+
+def after_delta(url, recipe_id, ingredient_id):
+    deltas = cycle(({'added': [ingredient_id]}, {'removed': [ingredient_id]}))
+
+    def build(state):
+        publish_delta(recipe_id, **next(deltas))
+        return url
+    return build
+
+
+def cookable_measures(name, dataset, repeat):
+    client = APIClient()
+    rnd = random.Random(0)
+    results = {}
+    for size in (3, 10, 30):
+        ingredients = rnd.sample(dataset['ingredient_ids'], size)
+        changed = next(ingredient for ingredient in dataset['ingredient_ids']
+                       if ingredient not in ingredients)
+        query = urlencode([('ingredients', i) for i in ingredients])
+        url = f'/api/recipes/cookable/?{query}'
+        results[f'{name}-sql-{size}'] = measure_queryset(
+            lambda: cookable_sql(ingredients), repeat)
+        get_ingredient_index()
+        results[f'{name}-index-{size}'] = measure_index(ingredients, repeat)
+        results.update(run_requests([
+            (f'{name}-cookable-{size}-rebuild', client, 'get',
+             after_bump(url, INDEX_VERSION), None),
+            (f'{name}-cookable-{size}-delta', client, 'get',
+             after_delta(url, dataset['recipe_ids'][0], changed), None),
+            (f'{name}-cookable-{size}', client, 'get', url, None),
+        ], repeat))
+    return results
+
+
+@suite('cookable')
+def cookable_suite(dataset, repeat):
+    results = cookable_measures('base', dataset, repeat)
+    recipe_ingredients = RecipeIngredient.objects.filter(
+        recipe_id=dataset['recipe_ids'][0]).count()
+    with transaction.atomic():
+        cookable_catalogue(dataset, COOKABLE_CATALOGUE, recipe_ingredients)
+        bump_version(INDEX_VERSION)
+        results.update(cookable_measures('large', dataset, repeat))
+        transaction.set_rollback(True)
+    bump_version(INDEX_VERSION)
+    return results
+
+
+def measure_call(func, repeat):
+    runs = []
+    for _ in range(repeat):
+        connection.queries_log.clear()
+        with CaptureQueriesContext(connection) as context:
+            start = time.perf_counter()
+            result = func()
+            elapsed = time.perf_counter() - start
+        runs.append({
+            'status': 200,
+            'queries': len(context),
+            'time_ms': elapsed * 1000,
+            'bytes': result if isinstance(result, int) else len(result),
+        })
+    return summarize(runs)
+
+
+def similar_sql(recipe_id):
+    ingredients = RecipeIngredient.objects.filter(
+        recipe_id=recipe_id).values('ingredient')
+    return Recipe.objects.exclude(id=recipe_id).annotate(
+        shared=Count('recipeingredient', filter=Q(
+            recipeingredient__ingredient__in=ingredients))
+    ).filter(shared__gt=0).order_by('-shared', 'id')
+
+
+@suite('similar')
+def similar_suite(dataset, repeat):
+    client = APIClient()
+    recipe_id = dataset['recipe_ids'][0]
+    limit = settings.SIMILAR_RECIPES_LIMIT
+    results = {
+        'batch-rebuild': measure_call(rebuild_similar, repeat),
+        'sql-shared-ingredients': measure_call(
+            lambda: list(similar_sql(recipe_id)[:limit]), repeat),
+        'incremental-refresh': measure_call(
+            lambda: refresh_similar([recipe_id]), repeat),
+    }
+    url = f'/api/recipes/{recipe_id}/similar/'
+    results.update(run_requests([
+        ('recipes-similar-miss', client, 'get',
+         after_bump(url, f'similar:{recipe_id}'), None),
+        ('recipes-similar-hit', client, 'get', url, None),
+    ], repeat))
+    return results
+
+
+@suite('feed')
+def feed_suite(dataset, repeat):
+    rnd = random.Random(0)
+    authors = list(Recipe.objects.filter(
+        id__in=dataset['recipe_ids']
+    ).values_list('author_id', flat=True).distinct().order_by('author_id'))
+    readers = {}
+    results = {}
+    number = count()
+    try:
+        for size in (10, 1000):
+            reader = User.objects.create(
+                username=f'bench_feed_{size}',
+                email=f'bench_feed_{size}@foodgram.ru'
+            )
+            Subscriptions.objects.bulk_create(
+                Subscriptions(user=reader, author_id=author_id)
+                for author_id in rnd.sample(authors, size)
+            )
+            readers[size] = reader
+        author = User.objects.get(id=Subscriptions.objects.filter(
+            user=readers[1000]).values_list('author_id', flat=True)[0])
+        publisher = APIClient()
+        publisher.force_authenticate(author)
+
+        def payload(state):
+            return {
+                'name': f'Рецепт для ленты {next(number)}',
+                'text': 'Описание',
+                'cooking_time': 10,
+                'image': IMAGE,
+                'tags': [],
+                'ingredients': [
+                    {'id': dataset['ingredient_ids'][0], 'amount': 10}],
+            }
+
+        options = dict(settings.RECIPE_IMAGES,
+                       BACKEND='recipes.images.SyncBackend')
+        for strategy, min_authors in (('read', 10 ** 9), ('timeline', 1)):
+            with override_settings(FEED_TIMELINE_MIN_AUTHORS=min_authors,
+                                   RECIPE_IMAGES=options):
+                TimelineEntry.objects.rebuild()
+                requests = []
+                for size, reader in readers.items():
+                    client = APIClient()
+                    client.force_authenticate(reader)
+                    name = f'feed-{strategy}-{size}-authors'
+                    requests.append((name, client, 'get',
+                                     '/api/recipes/feed/', None))
+                    requests.append((
+                        f'{name}-next', client, 'get',
+                        lambda state, name=name: state[name].json()['next'],
+                        None
+                    ))
+                requests.append((f'recipes-create-{strategy}', publisher,
+                                 'post', '/api/recipes/', payload))
+                results.update(run_requests(requests, repeat))
+    finally:
+        Recipe.objects.filter(name__startswith='Рецепт для ленты ').delete()
+        User.objects.filter(username__startswith='bench_feed_').delete()
+        TimelineEntry.objects.all().delete()
+    return results
@@ -0,0 +1,96 @@
+import hashlib
+from contextlib import contextmanager
+from urllib.parse import urlencode
+
+from django.core.cache import cache
+from django.http import QueryDict
+from django.utils.cache import get_conditional_response
+from rest_framework.response import Response
+
+from foodgram.versions import get_versions
+
+CACHE_NAMES = (
+    'tags', 'ingredients', 'ingredients-autocomplete',
+    'recipes-list', 'recipes-detail', 'recipes-similar',
+    'recipes-list-personal', 'recipes-detail-personal',
+)
+
+
+def count_lookup(name, hit):
+    key = f'stats:{name}:{"hits" if hit else "misses"}'
+    if not cache.add(key, 1, None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, 1, None)
+
+
+def get_stats(name):
+    return {
+        outcome: cache.get(f'stats:{name}:{outcome}', 0)
+        for outcome in ('hits', 'misses')
+    }
+
+
+def reset_stats(name):
+    cache.delete_many([f'stats:{name}:hits', f'stats:{name}:misses'])
+
+
+def normalize_params(query_params, allowed=None):
+    return urlencode(sorted(
+        (key, sorted(set(values)))
+        for key, values in query_params.lists()
+        if allowed is None or key in allowed
+    ), doseq=True)
+
+
+@contextmanager
+def only_params(request, params):
+    http_request = getattr(request, '_request', request)
+    query, meta = http_request.GET, http_request.META
+    query_string = meta.get('QUERY_STRING', '')
+    http_request.GET = QueryDict(normalize_params(query, params))
+    meta['QUERY_STRING'] = http_request.GET.urlencode()
+    try:
+        yield request
+    finally:
+        http_request.GET = query
+        meta['QUERY_STRING'] = query_string
+
+
+def response_digest(request, versions, params=None):
+    params = normalize_params(request.GET, params)
+    version = ':'.join(str(version) for version in get_versions(versions))
+    return hashlib.md5(
+        f'{request.get_host()}{request.path}?{params}:{version}'.encode()
+    ).hexdigest()
+
+
+def cached_response(request, versions, build_data, timeout,
+                    name=None, params=None,
+                    personal_version=None, personalize=None):
+    name = name or '-'.join(versions)
+    digest = response_digest(request, versions, params)
+    etag = f'"{digest}"'
+    if personal_version is not None:
+        etag = '"{}"'.format(hashlib.md5(
+            f'{digest}:{personal_version}'.encode()).hexdigest())
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        count_lookup(name, True)
+        not_modified['ETag'] = etag
+        return not_modified
+    key = f'response:{digest}'
+    data = cache.get(key)
+    count_lookup(name, data is not None)
+    cache_status = 'MISS' if data is None else 'HIT'
+    if data is None:
+        with only_params(request, params):
+            data = build_data()
+        cache.set(key, data, timeout)
+    if personalize is not None:
+        data = personalize(data)
+    response = Response(data)
+    response['ETag'] = etag
+    response['X-Cache'] = cache_status
+    return response
@@ -0,0 +1,95 @@
+import binascii
+import uuid
+from base64 import b64decode
+from tempfile import SpooledTemporaryFile
+
+from django.conf import settings
+from django.core.files import File
+from PIL import Image
+from rest_framework import serializers
+from rest_framework.fields import SkipField
+
+BASE64_MARKER = ';base64,'
+CHUNK_SIZE = 64 * 1024
+HEADER_SIZE = 256 * 1024
+
+
+class StreamingBase64ImageField(serializers.ImageField):
+    default_error_messages = {
+        'invalid_base64': 'Изображение должно быть передано строкой '
+                          'data:image/...;base64,...',
+        'too_large': 'Размер изображения не должен превышать '
+                     '{max_bytes} байт.',
+        'too_many_pixels': 'Изображение не должно содержать больше '
+                           '{max_pixels} пикселей.',
+    }
+
+    def to_internal_value(self, data):
+        if not isinstance(data, str):
+            return super().to_internal_value(data)
+        if data.startswith('http'):
+            raise SkipField()
+        start = data.find(BASE64_MARKER)
+        if not data.startswith('data:') or start == -1:
+            self.fail('invalid_base64')
+        start += len(BASE64_MARKER)
+        options = settings.RECIPE_IMAGES
+        if (len(data) - start) // 4 * 3 > options['MAX_UPLOAD_BYTES']:
+            self.fail('too_large', max_bytes=options['MAX_UPLOAD_BYTES'])
+        file = SpooledTemporaryFile(max_size=options['UPLOAD_SPOOL_SIZE'])
+        try:
+            self.decode(data, start, file, options['MAX_PIXELS'])
+            extension = self.check_image(file, options['MAX_PIXELS'])
+        except Exception:
+            file.close()
+            raise
+        file.seek(0)
+        return File(file, name=f'{uuid.uuid4()}.{extension}')
+
+    def decode(self, data, start, file, max_pixels):
+        pending = ''
+        header_checked = False
+        try:
+            for position in range(start, len(data), CHUNK_SIZE):
+                pending += ''.join(
+                    data[position:position + CHUNK_SIZE].split())
+                size = len(pending) // 4 * 4
+                file.write(b64decode(pending[:size], validate=True))
+                pending = pending[size:]
+                if not header_checked and file.tell() <= HEADER_SIZE:
+                    header_checked = self.check_header(file, max_pixels)
+            file.write(b64decode(pending, validate=True))
+        except binascii.Error:
+            self.fail('invalid_base64')
+
+    def check_header(self, file, max_pixels):
+        file.seek(0)
+        try:
+            with Image.open(file) as image:
+                too_many_pixels = image.width * image.height > max_pixels
+        except Image.DecompressionBombError:
+            too_many_pixels = True
+        except Exception:
+            return False
+        finally:
+            file.seek(0, 2)
+        if too_many_pixels:
+            self.fail('too_many_pixels', max_pixels=max_pixels)
+        return True
+
+    def check_image(self, file, max_pixels):
+        file.seek(0)
+        try:
+            image = Image.open(file)
+        except Image.DecompressionBombError:
+            self.fail('too_many_pixels', max_pixels=max_pixels)
+        except Exception:
+            self.fail('invalid_image')
+        with image:
+            if image.width * image.height > max_pixels:
+                self.fail('too_many_pixels', max_pixels=max_pixels)
+            try:
+                image.verify()
+            except Exception:
+                self.fail('invalid_image')
+            return image.format.lower()
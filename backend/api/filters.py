@@ -1,12 +1,16 @@
+from django.db.models import Exists, OuterRef
 from django_filters import rest_framework as filters
 
-from recipes.models import Favorite, Ingredient, Recipe, ShoppingList, Tag
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeTag,
+                            ShoppingList, Tag)
 from users.models import User
 
 
 class FilterIngredient(filters.FilterSet):
-    name = filters.CharFilter(
-        field_name='name', lookup_expr='istartswith')
+    name = filters.CharFilter(method='filter_name')
+
+    def filter_name(self, queryset, name, value):
+        return queryset.name_matches('startswith', value)
 
     class Meta:
         model = Ingredient
@@ -21,7 +25,8 @@ class FilterRecipe(filters.FilterSet):
     tags = filters.ModelMultipleChoiceFilter(
         field_name='tags__slug',
         to_field_name='slug',
-        queryset=Tag.objects.all()
+        queryset=Tag.objects.all(),
+        method='filter_tags'
     )
     is_favorited = filters.BooleanFilter(
         method='filter_is_favorited'
@@ -29,27 +34,40 @@ class FilterRecipe(filters.FilterSet):
     is_in_shopping_cart = filters.BooleanFilter(
         method='filter_is_in_shopping_cart'
     )
+    search = filters.CharFilter(method='filter_search')
+    ordering = filters.ChoiceFilter(
+        choices=(('popular', 'По популярности'),),
+        method='filter_ordering'
+    )
+
+    def filter_tags(self, queryset, name, value):
+        if not value:
+            return queryset
+        return queryset.filter(Exists(RecipeTag.objects.filter(
+            recipe=OuterRef('pk'), tag__in=value)))
 
     def filter_is_favorited(self, queryset, name, value):
         user = self.request.user
-        if user.is_authenticated:
-            if value:
-                favorit_obj = Favorite.objects.filter(user=user)
-                queryset = queryset.filter(
-                    id__in=favorit_obj.values('recipe_id'))
-                return queryset
+        if user.is_authenticated and value:
+            return queryset.filter(Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk'))))
         return queryset
 
     def filter_is_in_shopping_cart(self, queryset, name, value):
         user = self.request.user
-        if user.is_authenticated:
-            if value:
-                shopping_obj = ShoppingList.objects.filter(user=user)
-                queryset = queryset.filter(
-                    id__in=shopping_obj.values('recipe_id'))
-                return queryset
+        if user.is_authenticated and value:
+            return queryset.filter(Exists(ShoppingList.objects.filter(
+                user=user, recipe=OuterRef('pk'))))
         return queryset
 
+    def filter_search(self, queryset, name, value):
+        return queryset.search(value)
+
+    def filter_ordering(self, queryset, name, value):
+        return queryset.order_by(
+            '-favorites_count', '-in_carts_count', '-id')
+
     class Meta:
         model = Recipe
-        fields = ['author', 'tags', 'is_favorited', 'is_in_shopping_cart']
+        fields = ['author', 'tags', 'is_favorited', 'is_in_shopping_cart',
+                  'search', 'ordering']
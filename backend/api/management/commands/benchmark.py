@@ -0,0 +1,191 @@
+import json
+import tempfile
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+
+from api.benchmarks import SUITES, seed_dataset
+from recipes.images import get_backend
+
+
+class Command(BaseCommand):
+
+    help = ('Замер количества SQL-запросов, времени ответа и размера '
+            'ответа эндпоинтов API на синтетических данных во временной '
+            'базе данных со сравнением с сохранённым эталоном. Набор '
+            'endpoints покрывает все маршруты API, кроме '
+            'users/set_username/ и users/reset_username_confirm/: в djoser '
+            '2.2.0 при LOGIN_FIELD=email они отвечают ошибкой 500 на '
+            'корректные данные.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'suites',
+            nargs='*',
+            default=['endpoints'],
+            help=f'Наборы замеров: {", ".join(SUITES)}.',
+        )
+        parser.add_argument('--users', type=int, default=2000)
+        parser.add_argument('--recipes', type=int, default=3000)
+        parser.add_argument('--ingredients', type=int, default=1000)
+        parser.add_argument('--recipe-ingredients', type=int, default=8)
+        parser.add_argument('--favorites', type=int, default=10)
+        parser.add_argument('--subscriptions', type=int, default=5)
+        parser.add_argument('--carts', type=int, default=5)
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument(
+            '--baseline',
+            default=settings.DATA_DIR / 'benchmark_baseline.json',
+            help='Файл с эталонными результатами.',
+        )
+        parser.add_argument(
+            '--save-baseline',
+            action='store_true',
+            default=False,
+            help='Сохранить результаты как новый эталон.',
+        )
+        parser.add_argument(
+            '--bytes-tolerance',
+            type=float,
+            default=0.1,
+            help='Допустимый относительный рост размера ответа.',
+        )
+        parser.add_argument(
+            '--time-tolerance',
+            type=float,
+            default=None,
+            help='Допустимый относительный рост времени ответа. '
+                 'По умолчанию время не проверяется.',
+        )
+
+    def handle(self, *args, **options):
+        unknown = set(options['suites']).difference(SUITES)
+        if unknown:
+            raise CommandError(f'Неизвестные наборы: {", ".join(unknown)}')
+        dataset_options = {
+            name: options[name] for name in (
+                'users', 'recipes', 'ingredients', 'recipe_ingredients',
+                'favorites', 'subscriptions', 'carts')
+        }
+        results = self.run_suites(
+            options['suites'], dataset_options, options['repeat'])
+        self.print_results(results)
+        if options['save_baseline']:
+            self.save_baseline(
+                options['baseline'], dataset_options, options['repeat'],
+                results)
+            return
+        failures = self.compare(options, dataset_options, results)
+        if failures:
+            raise CommandError('Регрессии:\n' + '\n'.join(failures))
+        self.stdout.write(self.style.SUCCESS('Регрессий не обнаружено.'))
+
+    def run_suites(self, suites, dataset_options, repeat):
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False)
+        try:
+            return {
+                name: self.run_suite(name, dataset_options, repeat)
+                for name in suites
+            }
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def run_suite(self, name, dataset_options, repeat):
+        call_command('flush', interactive=False, verbosity=0)
+        cache.clear()
+        with tempfile.TemporaryDirectory() as media_root, override_settings(
+                ALLOWED_HOSTS=['testserver'],
+                MEDIA_ROOT=media_root,
+                EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend'):
+            dataset = seed_dataset(**dataset_options)
+            try:
+                return SUITES[name](dataset, repeat)
+            finally:
+                get_backend().wait()
+
+    def print_results(self, results):
+        for suite_name, suite in results.items():
+            self.stdout.write(self.style.MIGRATE_HEADING(suite_name))
+            self.stdout.write(
+                f'{"эндпоинт":<32}{"код":>5}{"запросы":>9}'
+                f'{"мс":>10}{"байты":>10}{"память, КБ":>12}')
+            for name, result in suite.items():
+                self.stdout.write(
+                    f'{name:<32}{result["status"]:>5}'
+                    f'{result["queries"]:>9}{result["time_ms"]:>10.2f}'
+                    f'{result["bytes"]:>10}{result.get("peak_kb", ""):>12}')
+
+    def save_baseline(self, path, dataset_options, repeat, results):
+        baseline = self.load_baseline(path) or {'suites': {}}
+        if (baseline.get('dataset') != dataset_options
+                or baseline.get('repeat') != repeat):
+            baseline = {'suites': {}}
+        baseline['dataset'] = dataset_options
+        baseline['repeat'] = repeat
+        baseline['suites'].update(results)
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(baseline, file, ensure_ascii=False, indent=2)
+            file.write('\n')
+        self.stdout.write(self.style.SUCCESS(f'Эталон сохранён в {path}.'))
+
+    def load_baseline(self, path):
+        try:
+            with open(path, encoding='utf-8') as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return None
+
+    def compare(self, options, dataset_options, results):
+        baseline = self.load_baseline(options['baseline'])
+        if baseline is None:
+            raise CommandError(
+                f'Эталон {options["baseline"]} не найден, '
+                f'запустите команду с --save-baseline.')
+        if baseline['dataset'] != dataset_options:
+            raise CommandError(
+                'Эталон записан на других параметрах данных: '
+                f'{baseline["dataset"]}.')
+        if baseline.get('repeat') != options['repeat']:
+            raise CommandError(
+                'Эталон записан с другим числом повторов: '
+                f'{baseline.get("repeat")}.')
+        failures = []
+        for suite_name, suite in results.items():
+            expected_suite = baseline['suites'].get(suite_name, {})
+            for name, result in suite.items():
+                expected = expected_suite.get(name)
+                if expected is None:
+                    self.stdout.write(f'{suite_name}/{name}: нет в эталоне')
+                    continue
+                failures.extend(
+                    f'{suite_name}/{name}: {problem}'
+                    for problem in self.regressions(
+                        result, expected, options))
+        return failures
+
+    def regressions(self, result, expected, options):
+        if result['status'] != expected['status']:
+            yield f'код ответа {expected["status"]} -> {result["status"]}'
+        if result['queries'] > expected['queries']:
+            yield f'запросы {expected["queries"]} -> {result["queries"]}'
+        bytes_limit = expected['bytes'] * (1 + options['bytes_tolerance'])
+        if result['bytes'] > bytes_limit:
+            yield f'байты {expected["bytes"]} -> {result["bytes"]}'
+        if 'peak_kb' in expected:
+            memory_limit = expected['peak_kb'] * (
+                1 + options['bytes_tolerance'])
+            if result.get('peak_kb', 0) > memory_limit:
+                yield (f'память {expected["peak_kb"]} КБ -> '
+                       f'{result["peak_kb"]} КБ')
+        time_tolerance = options['time_tolerance']
+        if time_tolerance is not None:
+            time_limit = expected['time_ms'] * (1 + time_tolerance)
+            if result['time_ms'] > time_limit:
+                yield (f'время {expected["time_ms"]} мс -> '
+                       f'{result["time_ms"]} мс')
@@ -0,0 +1,38 @@
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand, CommandError
+
+from api.cache import CACHE_NAMES, get_stats, reset_stats
+
+
+class Command(BaseCommand):
+
+    help = 'Статистика попаданий в кэш ответов API.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reset',
+            action='store_true',
+            dest='reset',
+            default=False,
+            help='Обнулить счётчики после вывода.',
+        )
+
+    def handle(self, *args, **options):
+        if isinstance(caches['default'], (LocMemCache, DummyCache)):
+            raise CommandError(
+                'Счётчики хранятся в кэше процесса приложения и недоступны '
+                'команде. Укажите общий кэш в CACHE_BACKEND и '
+                'CACHE_LOCATION (например, Memcached или DatabaseCache).')
+        self.stdout.write(
+            f'{"кэш":<28}{"попадания":>12}{"промахи":>10}{"доля":>8}')
+        for name in CACHE_NAMES:
+            stats = get_stats(name)
+            total = stats['hits'] + stats['misses']
+            ratio = stats['hits'] / total if total else 0
+            self.stdout.write(
+                f'{name:<28}{stats["hits"]:>12}{stats["misses"]:>10}'
+                f'{ratio:>8.0%}')
+            if options['reset']:
+                reset_stats(name)
@@ -0,0 +1,128 @@
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import count
+from urllib.parse import quote
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.models import Recipe
+
+DEFAULT_PATHS = (
+    '/api/tags/',
+    f'/api/ingredients/autocomplete/?name={quote("мол")}',
+    '/api/recipes/',
+    '/api/recipes/?page=2',
+)
+
+
+def percentile(values, percent):
+    if len(values) < 2:
+        return values[0] if values else 0
+    return statistics.quantiles(values, n=100)[percent - 1]
+
+
+class Command(BaseCommand):
+
+    help = ('Нагрузочное тестирование запущенных серверов (например, WSGI '
+            'и ASGI на одной машине): пропускная способность и задержки '
+            'p50/p99 для каждого пути.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'targets',
+            nargs='+',
+            help='Серверы в виде имя=http://host:port или http://host:port.',
+        )
+        parser.add_argument(
+            '--paths',
+            nargs='+',
+            help='Пути запросов. По умолчанию теги, автодополнение '
+                 'ингредиентов, список и страница рецепта.',
+        )
+        parser.add_argument('--concurrency', type=int, default=32)
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=2000,
+            help='Количество запросов к каждому серверу.',
+        )
+        parser.add_argument(
+            '--warmup',
+            type=int,
+            default=50,
+            help='Количество запросов до начала замера.',
+        )
+        parser.add_argument('--timeout', type=float, default=10)
+
+    def handle(self, *args, **options):
+        paths = options['paths'] or self.default_paths()
+        self.stdout.write(
+            f'{"сервер":<10}{"путь":<48}{"запросы":>9}{"ошибки":>8}'
+            f'{"rps":>9}{"p50, мс":>10}{"p99, мс":>10}')
+        for target in options['targets']:
+            name, _, url = target.rpartition('=')
+            name = name or url
+            self.run(url.rstrip('/'), paths, options, options['warmup'])
+            elapsed, latencies, errors = self.run(
+                url.rstrip('/'), paths, options, options['requests'])
+            for path in paths:
+                self.print_row(name, path, latencies[path], errors[path],
+                               elapsed)
+            self.print_row(
+                name, 'всего',
+                [value for values in latencies.values() for value in values],
+                sum(errors.values()), elapsed)
+
+    def default_paths(self):
+        recipe_id = Recipe.objects.values_list('id', flat=True).first()
+        if recipe_id is None:
+            return DEFAULT_PATHS
+        return DEFAULT_PATHS + (f'/api/recipes/{recipe_id}/',)
+
+    def run(self, url, paths, options, total):
+        numbers = count()
+        local = threading.local()
+        latencies = {path: [] for path in paths}
+        errors = dict.fromkeys(paths, 0)
+
+        def worker():
+            session = getattr(local, 'session', None)
+            if session is None:
+                session = local.session = requests.Session()
+            while True:
+                number = next(numbers)
+                if number >= total:
+                    return
+                path = paths[number % len(paths)]
+                start = time.perf_counter()
+                try:
+                    response = session.get(
+                        url + path, timeout=options['timeout'])
+                    failed = response.status_code != 200
+                except requests.RequestException:
+                    failed = True
+                latencies[path].append(time.perf_counter() - start)
+                if failed:
+                    errors[path] += 1
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(options['concurrency']) as executor:
+            futures = [executor.submit(worker)
+                       for _ in range(options['concurrency'])]
+        for future in futures:
+            future.result()
+        elapsed = time.perf_counter() - start
+        if total and all(
+                errors[path] == len(latencies[path]) for path in paths):
+            raise CommandError(f'Сервер {url} не отвечает на запросы.')
+        return elapsed, latencies, errors
+
+    def print_row(self, name, path, latencies, errors, elapsed):
+        self.stdout.write(
+            f'{name:<10}{path[:47]:<48}{len(latencies):>9}{errors:>8}'
+            f'{len(latencies) / elapsed:>9.0f}'
+            f'{percentile(latencies, 50) * 1000:>10.1f}'
+            f'{percentile(latencies, 99) * 1000:>10.1f}')
@@ -0,0 +1,32 @@
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+class PageNumberOrCursorPagination(PageNumberPagination):
+    cursor_query_param = 'cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_paginator = None
+        if (self.cursor_query_param not in request.query_params
+                or isinstance(queryset, list)):
+            return super().paginate_queryset(queryset, request, view)
+        ordering = getattr(view, 'cursor_ordering', '-id')
+        if queryset.query.order_by and tuple(
+                queryset.query.order_by) != (ordering,):
+            raise ValidationError({self.cursor_query_param: [
+                'Постраничный вывод по курсору не поддерживает '
+                'сортировку и поиск.']})
+        self.cursor_paginator = CursorPagination()
+        self.cursor_paginator.page_size = self.page_size
+        self.cursor_paginator.ordering = ordering
+        return self.cursor_paginator.paginate_queryset(
+            queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+
+class FeedPagination(CursorPagination):
+    ordering = '-id'
@@ -0,0 +1,46 @@
+from django.conf import settings
+from django.core.cache import cache
+
+from foodgram.versions import bump_version, get_versions
+from recipes.models import Favorite, ShoppingList
+from users.models import Subscriptions
+
+USER_SETS = {
+    'favorites': (Favorite, 'recipe_id'),
+    'shopping_cart': (ShoppingList, 'recipe_id'),
+    'subscriptions': (Subscriptions, 'author_id'),
+}
+MODEL_USER_SETS = {model: name for name, (model, _) in USER_SETS.items()}
+
+
+def user_set_version(user_id, name):
+    return f'user:{user_id}:{name}'
+
+
+def bump_user_set(user_id, name):
+    bump_version(user_set_version(user_id, name))
+
+
+def get_user_sets(user):
+    version = ':'.join(str(version) for version in get_versions(
+        [user_set_version(user.id, name) for name in USER_SETS]))
+    key = f'user-sets:{user.id}:{version}'
+    sets = cache.get(key)
+    if sets is None:
+        sets = {
+            name: set(model.objects.filter(
+                user=user).values_list(field, flat=True))
+            for name, (model, field) in USER_SETS.items()
+        }
+        cache.set(key, sets, settings.USER_SETS_CACHE_TIMEOUT)
+    return sets, version
+
+
+def personalize(data, sets):
+    recipes = data['results'] if 'results' in data else [data]
+    for recipe in recipes:
+        recipe['is_favorited'] = recipe['id'] in sets['favorites']
+        recipe['is_in_shopping_cart'] = recipe['id'] in sets['shopping_cart']
+        recipe['author']['is_subscribed'] = (
+            recipe['author']['id'] in sets['subscriptions'])
+    return data
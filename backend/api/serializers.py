@@ -1,12 +1,44 @@
-from django.shortcuts import get_object_or_404
+from django.conf import settings
+from django.db import models, transaction
 from djoser.serializers import UserCreateSerializer, UserSerializer
-from drf_base64.fields import Base64ImageField
 from rest_framework import serializers
 
 from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
-                            ShoppingList, Tag)
+                            ShoppingList, ShoppingListIngredient, Tag)
+from recipes.matching import recipe_ingredients_changed
+from recipes.similarity import schedule_similar_refresh
 from users.models import Subscriptions, User
 
+from .fields import StreamingBase64ImageField
+from .utils import get_recipes_limit
+
+
+def preload_subscriptions(context, author_ids):
+    request = context.get('request')
+    if not request or request.user.is_anonymous:
+        return
+    subscriptions = context.setdefault('subscriptions', {})
+    missing = set(author_ids).difference(subscriptions)
+    if not missing:
+        return
+    subscribed = set(Subscriptions.objects.filter(
+        user=request.user, author_id__in=missing
+    ).values_list('author_id', flat=True))
+    subscriptions.update(
+        (author_id, author_id in subscribed) for author_id in missing)
+
+
+class SubscriptionsPreloadListSerializer(serializers.ListSerializer):
+
+    def to_representation(self, data):
+        if isinstance(data, models.Manager):
+            data = data.all()
+        data = list(data)
+        author_field = self.child.subscription_author_field
+        preload_subscriptions(
+            self.context, [getattr(item, author_field) for item in data])
+        return super().to_representation(data)
+
 
 class UserRegistrationSerializer(UserCreateSerializer):
     class Meta(UserCreateSerializer.Meta):
@@ -17,18 +49,22 @@ class UserRegistrationSerializer(UserCreateSerializer):
 
 class CustomUserSerializer(UserSerializer):
     is_subscribed = serializers.SerializerMethodField(read_only=True)
+    subscription_author_field = 'id'
 
     class Meta:
         model = User
         fields = ('id', 'email', 'username', 'first_name',
                   'last_name', 'is_subscribed')
+        list_serializer_class = SubscriptionsPreloadListSerializer
 
     def get_is_subscribed(self, obj):
-        request = self.context['request']
-        user = request.user
-        if not request or user.is_anonymous:
+        request = self.context.get('request')
+        if not request or request.user.is_anonymous:
             return False
-        return Subscriptions.objects.filter(user=user,
+        subscriptions = self.context.get('subscriptions', {})
+        if obj.id in subscriptions:
+            return subscriptions[obj.id]
+        return Subscriptions.objects.filter(user=request.user,
                                             author=obj).exists()
 
 
@@ -55,23 +91,42 @@ class RecipeIngredientSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'measurement_unit', 'amount')
 
 
+class ImageVariantField(serializers.ImageField):
+
+    def __init__(self, variant, **kwargs):
+        self.variant = variant
+        kwargs.update(source='*', read_only=True)
+        super().__init__(**kwargs)
+
+    def to_representation(self, recipe):
+        return super().to_representation(
+            getattr(recipe, self.variant) or recipe.image)
+
+
 class RecipeSerializer(serializers.ModelSerializer):
-    image = Base64ImageField()
+    image = StreamingBase64ImageField()
+    image_webp = ImageVariantField('image_webp')
+    thumbnail = ImageVariantField('thumbnail')
     tags = TagSerializer(many=True, read_only=True)
     author = CustomUserSerializer(read_only=True)
     ingredients = RecipeIngredientSerializer(
         many=True, source='recipeingredient_set', read_only=True)
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
+    subscription_author_field = 'author_id'
 
     class Meta:
         model = Recipe
         fields = ('id', 'tags', 'author', 'ingredients',
                   'is_favorited', 'is_in_shopping_cart',
-                  'name', 'image', 'text', 'cooking_time')
+                  'name', 'image', 'image_webp', 'thumbnail', 'text',
+                  'cooking_time')
         read_only_fields = ('is_favorite', 'is_shopping_cart')
+        list_serializer_class = SubscriptionsPreloadListSerializer
 
     def get_is_favorited(self, recipe):
+        if hasattr(recipe, 'is_favorited'):
+            return recipe.is_favorited
         request = self.context['request']
         user = request.user
         if user.is_anonymous:
@@ -79,6 +134,8 @@ class RecipeSerializer(serializers.ModelSerializer):
         return user.favorite_user.filter(recipe=recipe).exists()
 
     def get_is_in_shopping_cart(self, recipe):
+        if hasattr(recipe, 'is_in_shopping_cart'):
+            return recipe.is_in_shopping_cart
         request = self.context['request']
         user = request.user
         if user.is_anonymous:
@@ -96,7 +153,7 @@ class CreateRecipeIngredientSerializer(serializers.ModelSerializer):
 
 
 class CreateRecipeSerializer(serializers.ModelSerializer):
-    image = Base64ImageField()
+    image = StreamingBase64ImageField()
     tags = serializers.PrimaryKeyRelatedField(
         many=True, queryset=Tag.objects.all())
     ingredients = CreateRecipeIngredientSerializer(
@@ -108,30 +165,62 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
                   'image', 'text', 'cooking_time')
 
     def validate(self, data):
-        ingredients_list = []
-        for item in data.get('recipeingredient_set'):
-            if item['id'] in ingredients_list:
-                raise serializers.ValidationError(
-                    'Нельзя указывать один ингредиент несколько раз')
-            ingredients_list.append(item['id'])
-            if item['amount'] <= 0:
-                raise serializers.ValidationError(
-                    'Не верно указано количество')
+        ingredients = data.get('recipeingredient_set') or ()
+        ingredient_ids = [item['id'] for item in ingredients]
+        if len(set(ingredient_ids)) != len(ingredient_ids):
+            raise serializers.ValidationError(
+                'Нельзя указывать один ингредиент несколько раз')
+        if any(item['amount'] <= 0 for item in ingredients):
+            raise serializers.ValidationError(
+                'Не верно указано количество')
+        found = Ingredient.objects.in_bulk(ingredient_ids)
+        missing = [str(id) for id in ingredient_ids if id not in found]
+        if missing:
+            raise serializers.ValidationError({
+                'ingredients': 'Ингредиенты не найдены: '
+                               f'{", ".join(missing)}'
+            })
+        for item in ingredients:
+            item['ingredient'] = found[item['id']]
         return data
 
     def ingredients_bulk_create(self, recipe, ingredients):
-        ing_objs = []
-        for item in ingredients:
-            id = item.get('id')
-            amount = item.get('amount')
-            ingredient = get_object_or_404(Ingredient, id=id)
-            ing_objs.append(
-                RecipeIngredient(
-                    recipe=recipe, ingredient=ingredient, amount=amount
-                )
+        recipe_ingredients_changed(
+            recipe.id, [item['id'] for item in ingredients])
+        return RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe=recipe,
+                ingredient=item['ingredient'],
+                amount=item['amount']
             )
-        return RecipeIngredient.objects.bulk_create(ing_objs)
-
+            for item in ingredients
+        )
+
+    def ingredients_update(self, recipe, ingredients):
+        existing = {
+            row.ingredient_id: row
+            for row in recipe.recipeingredient_set.all()
+        }
+        amounts = {item['id']: item['amount'] for item in ingredients}
+        changed = [
+            row for ingredient_id, row in existing.items()
+            if ingredient_id in amounts
+            and row.amount != amounts[ingredient_id]
+        ]
+        for row in changed:
+            row.amount = amounts[row.ingredient_id]
+        RecipeIngredient.objects.bulk_update(changed, ['amount'])
+        removed = existing.keys() - amounts.keys()
+        if removed:
+            RecipeIngredient.objects.filter(
+                recipe=recipe, ingredient_id__in=removed).delete()
+        added = [item for item in ingredients if item['id'] not in existing]
+        self.ingredients_bulk_create(recipe, added)
+        return removed.union(
+            row.ingredient_id for row in changed
+        ).union(item['id'] for item in added)
+
+    @transaction.atomic
     def create(self, validated_data):
         request = self.context['request']
         tags = validated_data.pop('tags')
@@ -140,8 +229,10 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
         recipe = super().create(validated_data)
         recipe.tags.set(tags)
         self.ingredients_bulk_create(recipe, ingredients)
+        schedule_similar_refresh(recipe.id)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('recipeingredient_set')
@@ -151,24 +242,76 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
             instance.tags.set(tags)
 
         if ingredients:
-            instance.ingredients.clear()
-            self.ingredients_bulk_create(instance, ingredients)
+            ingredient_ids = self.ingredients_update(instance, ingredients)
+            if ingredient_ids:
+                transaction.on_commit(
+                    lambda: ShoppingListIngredient.objects.refresh_recipe(
+                        instance.id, ingredient_ids)
+                )
+
+        if tags or ingredients:
+            schedule_similar_refresh(instance.id)
 
         instance.save()
         return instance
 
     def to_representation(self, value):
         request = self.context['request']
+        models.prefetch_related_objects(
+            [value],
+            'tags',
+            models.Prefetch(
+                'recipeingredient_set',
+                queryset=RecipeIngredient.objects.select_related(
+                    'ingredient')
+            )
+        )
         return RecipeSerializer(
             value,
             context={'request': request}
         ).data
 
 
+class BulkRecipesSerializer(serializers.Serializer):
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.BULK_RECIPES_LIMIT
+    )
+
+    def validate_recipes(self, value):
+        return list(dict.fromkeys(value))
+
+
+class IngredientSetSerializer(serializers.Serializer):
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.COOKABLE_INGREDIENTS_LIMIT
+    )
+    max_missing = serializers.IntegerField(min_value=0, required=False)
+
+
+class CookableRecipeSerializer(RecipeSerializer):
+    missing_ingredients = serializers.IntegerField(read_only=True)
+
+    class Meta(RecipeSerializer.Meta):
+        fields = RecipeSerializer.Meta.fields + ('missing_ingredients',)
+
+
 class ShortRecipeSerializer(serializers.ModelSerializer):
+    thumbnail = ImageVariantField('thumbnail')
+
     class Meta:
         model = Recipe
-        fields = 'id', 'name', 'image', 'cooking_time'
+        fields = 'id', 'name', 'image', 'thumbnail', 'cooking_time'
+
+
+class SimilarRecipeSerializer(ShortRecipeSerializer):
+    score = serializers.FloatField(read_only=True)
+
+    class Meta(ShortRecipeSerializer.Meta):
+        fields = ShortRecipeSerializer.Meta.fields + ('score',)
 
 
 class SubscriptionsSerializer(serializers.ModelSerializer):
@@ -177,13 +320,15 @@ class SubscriptionsSerializer(serializers.ModelSerializer):
     username = serializers.ReadOnlyField(source='author.username')
     first_name = serializers.ReadOnlyField(source='author.first_name')
     last_name = serializers.ReadOnlyField(source='author.last_name')
-    recipes = ShortRecipeSerializer(
-        source='author.recipes', read_only=True, many=True)
+    recipes = serializers.SerializerMethodField()
     is_subscribed = serializers.SerializerMethodField()
-    recipes_count = serializers.IntegerField(
-        source='author.recipes.count',
-        read_only=True
-    )
+    recipes_count = serializers.SerializerMethodField()
+
+    default_error_messages = {
+        'exists': 'Вы уже подписаны на этого автора',
+        'not_exists': 'Вы не были подписаны на этого автора',
+        'self_subscribe': 'Нельзя подписаться на самого себя',
+    }
 
     class Meta:
         model = Subscriptions
@@ -192,30 +337,27 @@ class SubscriptionsSerializer(serializers.ModelSerializer):
                   'last_name', 'is_subscribed',
                   'recipes', 'recipes_count')
 
-    def validate(self, data):
-        request = self.context['request']
-        user = request.user
-        author_id = request.data['id']
-        author = get_object_or_404(User, id=author_id)
-        if request.method == 'POST':
-            if user == author:
-                raise serializers.ValidationError(
-                    'Нельзя подписаться на самого себя')
-            if author.subscribing.filter(user=user).exists():
-                raise serializers.ValidationError(
-                    'Вы уже подписаны на этого автора')
-        if request.method == 'DELETE':
-            if not author.subscribing.filter(user=user).exists():
-                raise serializers.ValidationError(
-                    'Вы не были подписаны на этого автора')
-        return data
-
     def get_is_subscribed(self, obj):
         request = self.context['request']
         if not request.user.is_authenticated or not obj:
             return False
         return True
 
+    def get_recipes(self, obj):
+        author = obj.author
+        if hasattr(author, 'recipes_preview'):
+            recipes = author.recipes_preview
+        else:
+            limit = get_recipes_limit(self.context['request'])
+            recipes = author.recipes.limited_per_author(limit)
+        return ShortRecipeSerializer(
+            recipes, many=True, context=self.context).data
+
+    def get_recipes_count(self, obj):
+        if hasattr(obj, 'recipes_count'):
+            return obj.recipes_count
+        return obj.author.recipes.count()
+
 
 class FavoriteSerializer(serializers.ModelSerializer):
     id = serializers.ReadOnlyField(source='recipe.id')
@@ -223,25 +365,15 @@ class FavoriteSerializer(serializers.ModelSerializer):
     cooking_time = serializers.ReadOnlyField(source='recipe.cooking_time')
     image = serializers.SerializerMethodField()
 
+    default_error_messages = {
+        'exists': 'Рецепт уже есть в избранном',
+        'not_exists': 'Рецепта нет в избранном',
+    }
+
     class Meta:
         model = Favorite
         fields = ('id', 'name', 'image', 'cooking_time')
 
-    def validate(self, data):
-        request = self.context['request']
-        user = request.user
-        recipe_id = request.data['id']
-        recipe = get_object_or_404(Recipe, id=recipe_id)
-        if request.method == 'POST':
-            if recipe.in_favorite.filter(user=user).exists():
-                raise serializers.ValidationError(
-                    'Рецепт уже есть в избранном')
-        if request.method == 'DELETE':
-            if not recipe.in_favorite.filter(user=user).exists():
-                raise serializers.ValidationError(
-                    'Рецепта нет в избранном')
-        return data
-
     def get_image(self, obj):
         request = self.context['request']
         image_url = obj.recipe.image.url
@@ -254,27 +386,15 @@ class ShoppingListSerializer(serializers.ModelSerializer):
     cooking_time = serializers.ReadOnlyField(source='recipe.cooking_time')
     image = serializers.SerializerMethodField()
 
+    default_error_messages = {
+        'exists': 'Рецепт уже есть в списке покупок',
+        'not_exists': 'Рецепта нет в списке покупок',
+    }
+
     class Meta:
         model = ShoppingList
         fields = ('id', 'name', 'image', 'cooking_time')
 
-    def validate(self, data):
-        request = self.context['request']
-        user = request.user
-        recipe_id = request.data['id']
-        recipe = get_object_or_404(Recipe, id=recipe_id)
-        if request.method == 'POST':
-            if recipe.in_shopping_list.filter(user=user).exists():
-                raise serializers.ValidationError(
-                    'Рецепт уже есть в списке покупок'
-                )
-        if request.method == 'DELETE':
-            if not recipe.in_shopping_list.filter(user=user).exists():
-                raise serializers.ValidationError(
-                    'Рецепта нет в списке покупок'
-                )
-        return data
-
     def get_image(self, obj):
         request = self.context['request']
         image_url = obj.recipe.image.url
@@ -0,0 +1,77 @@
+from django.db import transaction
+from django.db.models.signals import (m2m_changed, post_delete, post_init,
+                                      post_save)
+from django.dispatch import receiver
+
+from foodgram.versions import bump_version
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            RecipeTag, ShoppingList, Tag,
+                            user_recipes_changed)
+from users.models import Subscriptions, User
+
+from .personalization import MODEL_USER_SETS, bump_user_set
+
+AUTHOR_FIELDS = ('username', 'first_name', 'last_name', 'email')
+
+
+@receiver([post_save, post_delete], sender=Tag)
+def tags_changed(sender, **kwargs):
+    bump_version('tags')
+
+
+@receiver([post_save, post_delete], sender=Ingredient)
+def ingredients_changed(sender, **kwargs):
+    bump_version('ingredients')
+
+
+def bump_recipes_on_commit():
+    transaction.on_commit(lambda: bump_version('recipes'))
+
+
+@receiver([post_save, post_delete], sender=Recipe)
+@receiver([post_save, post_delete], sender=RecipeIngredient)
+@receiver([post_save, post_delete], sender=RecipeTag)
+def recipes_changed(sender, **kwargs):
+    bump_recipes_on_commit()
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(sender, action, **kwargs):
+    if action.startswith('post_'):
+        bump_recipes_on_commit()
+
+
+def author_state(instance):
+    return tuple(instance.__dict__.get(field) for field in AUTHOR_FIELDS)
+
+
+@receiver(post_init, sender=User)
+def author_loaded(sender, instance, **kwargs):
+    instance.author_state = author_state(instance)
+
+
+@receiver(post_save, sender=User)
+def author_changed(sender, instance, created, update_fields=None, **kwargs):
+    if update_fields is not None and not set(
+            update_fields).intersection(AUTHOR_FIELDS):
+        return
+    state = author_state(instance)
+    if created or state == instance.author_state:
+        return
+    instance.author_state = state
+    if instance.recipes.exists():
+        bump_recipes_on_commit()
+
+
+@receiver([post_save, post_delete], sender=Favorite)
+@receiver([post_save, post_delete], sender=ShoppingList)
+@receiver([post_save, post_delete], sender=Subscriptions)
+def user_set_changed(sender, instance, **kwargs):
+    transaction.on_commit(
+        lambda: bump_user_set(instance.user_id, MODEL_USER_SETS[sender]))
+
+
+@receiver(user_recipes_changed)
+def user_recipes_set_changed(sender, user, **kwargs):
+    transaction.on_commit(
+        lambda: bump_user_set(user.id, MODEL_USER_SETS[sender]))
@@ -1,7 +1,9 @@
+from django.conf import settings
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
 from . import views
+from .async_views import async_urlpatterns
 
 app_name = 'api'
 
@@ -16,3 +18,6 @@ urlpatterns = [
     path('', include(router.urls)),
     path('auth/', include('djoser.urls.authtoken')),
 ]
+
+if settings.ASYNC_API_VIEWS:
+    urlpatterns = async_urlpatterns(router.urls) + urlpatterns
@@ -1,37 +1,115 @@
-from django.http import HttpResponse
-from django.shortcuts import get_object_or_404
-from rest_framework import status
+import csv
+import json
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.db import IntegrityError, transaction
+from django.http import Http404, StreamingHttpResponse
+from rest_framework import serializers, status
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 
 
-def create_shopping_list(user, ingredients):
-    shopping_list = (
-        f'Список покупок пользователя: {user.get_full_name()}\n\n'
-    )
+def get_recipes_limit(request):
+    limit = settings.SUBSCRIPTIONS_RECIPES_LIMIT
+    try:
+        return min(int(request.query_params['recipes_limit']), limit)
+    except (KeyError, ValueError):
+        return limit
+
+
+@contextmanager
+def as_anonymous(request):
+    user = request.user
+    request.user = AnonymousUser()
+    try:
+        yield request
+    finally:
+        request.user = user
+
+
+class Echo:
+
+    def write(self, value):
+        return value
+
+
+def shopping_list_txt(user, ingredients):
+    yield f'Список покупок пользователя: {user.get_full_name()}\n\n'
+    for ingredient in ingredients:
+        yield (f'- {ingredient["ingredient__name"]} '
+               f'({ingredient["ingredient__measurement_unit"]})'
+               f' - {ingredient["amount"]}\n')
+
+
+def shopping_list_csv(user, ingredients):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('Ингредиент', 'Единица измерения', 'Количество'))
     for ingredient in ingredients:
-        shopping_list += ''.join([
-            f'- {ingredient["ingredient__name"]} '
-            f'({ingredient["ingredient__measurement_unit"]})'
-            f' - {ingredient["amount"]}\n'
-        ])
-    filename = f'{user.username}_shopping_list.txt'
-    response = HttpResponse(shopping_list, headers={
-        'Content-Type': 'text/plain',
-        'Content-Disposition': f'attachment; filename={filename}'
-    })
-
-    return response
-
-
-def post_func(serializer, **kwargs):
-    serializer.is_valid(raise_exception=True)
-    serializer.save(**kwargs)
+        yield writer.writerow((
+            ingredient['ingredient__name'],
+            ingredient['ingredient__measurement_unit'],
+            ingredient['amount']
+        ))
+
+
+def shopping_list_json(user, ingredients):
+    separator = '['
+    for ingredient in ingredients:
+        yield separator + json.dumps({
+            'name': ingredient['ingredient__name'],
+            'measurement_unit': ingredient['ingredient__measurement_unit'],
+            'amount': ingredient['amount'],
+        }, ensure_ascii=False)
+        separator = ','
+    yield '[]' if separator == '[' else ']'
+
+
+SHOPPING_LIST_WRITERS = {
+    'txt': shopping_list_txt,
+    'csv': shopping_list_csv,
+    'json': shopping_list_json,
+}
+
+
+def create_shopping_list(user, ingredients, renderer, etag):
+    writer = SHOPPING_LIST_WRITERS[renderer.format]
+    filename = f'{user.username}_shopping_list.{renderer.format}'
+    return StreamingHttpResponse(
+        writer(user, ingredients.iterator()),
+        headers={
+            'Content-Type': f'{renderer.media_type}; charset=utf-8',
+            'Content-Disposition': f'attachment; filename={filename}',
+            'ETag': etag,
+        }
+    )
+
+
+def non_field_error(serializer_class, code):
+    return serializers.ValidationError(
+        {api_settings.NON_FIELD_ERRORS_KEY: [
+            serializer_class().error_messages[code]]},
+        code=code
+    )
+
+
+def post_func(serializer_class, request, **kwargs):
+    try:
+        with transaction.atomic():
+            instance = serializer_class.Meta.model.objects.create(**kwargs)
+    except IntegrityError:
+        raise non_field_error(serializer_class, 'exists')
+    serializer = serializer_class(instance, context={'request': request})
     return Response(
         serializer.data, status=status.HTTP_201_CREATED)
 
 
-def delete_func(serializer, сlass_obj, **kwargs):
-    serializer.is_valid(raise_exception=True)
-    obj_for_del = get_object_or_404(сlass_obj, **kwargs)
-    obj_for_del.delete()
-    return Response(status=status.HTTP_204_NO_CONTENT)
+def delete_func(serializer_class, target, **kwargs):
+    deleted, _ = serializer_class.Meta.model.objects.filter(
+        **kwargs).delete()
+    if deleted:
+        return Response(status=status.HTTP_204_NO_CONTENT)
+    if not target.exists():
+        raise Http404
+    raise non_field_error(serializer_class, 'not_exists')
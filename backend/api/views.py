@@ -1,27 +1,50 @@
-from django.db.models import Sum
+import hashlib
+
+from django.conf import settings
+from django.db.models import Count, F, Max, Prefetch, Sum
+from django.db.models.functions import Lower
 from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response
 from django_filters import rest_framework as filters
 from djoser.views import UserViewSet as DjoserUserViewSet
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
+from rest_framework.parsers import FormParser, MultiPartParser
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 
+from recipes.matching import get_ingredient_index
 from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
                             ShoppingList, Tag)
 from users.models import Subscriptions, User
+
+from .cache import cached_response
 from .filters import FilterIngredient, FilterRecipe
+from .pagination import FeedPagination
+from .parsers import LimitedJSONParser
 from .permissions import AuthorOrStaffOrReadOnly
-from .serializers import (CreateRecipeSerializer,
-                          FavoriteSerializer, IngredientSerializer,
+from .personalization import get_user_sets, personalize
+from .renderers import CSVRenderer, PlainTextRenderer
+from .serializers import (BulkRecipesSerializer, CookableRecipeSerializer,
+                          CreateRecipeSerializer, FavoriteSerializer,
+                          IngredientSerializer, IngredientSetSerializer,
                           RecipeSerializer, ShoppingListSerializer,
-                          SubscriptionsSerializer, TagSerializer)
-from .utils import create_shopping_list, delete_func, post_func
+                          SimilarRecipeSerializer, SubscriptionsSerializer,
+                          TagSerializer)
+from .utils import (as_anonymous, create_shopping_list, delete_func,
+                    get_recipes_limit, non_field_error, post_func)
 
 
 class UserViewSet(DjoserUserViewSet):
     queryset = User.objects.all()
 
+    @property
+    def cursor_ordering(self):
+        if self.action == 'subscriptions':
+            return '-id'
+        return 'id'
+
     @action(
         detail=False,
         methods=['get'],
@@ -29,9 +52,17 @@ class UserViewSet(DjoserUserViewSet):
     )
     def subscriptions(self, request):
         user = self.request.user
-        pages = self.paginate_queryset(
-            Subscriptions.objects.filter(user=user)
-        )
+        recipes = Recipe.objects.limited_per_author(
+            get_recipes_limit(request))
+        queryset = Subscriptions.objects.filter(
+            user=user
+        ).select_related('author').annotate(
+            recipes_count=Count('author__recipes')
+        ).prefetch_related(
+            Prefetch('author__recipes', queryset=recipes,
+                     to_attr='recipes_preview')
+        ).order_by('-id')
+        pages = self.paginate_queryset(queryset)
 
         serializer = SubscriptionsSerializer(
             pages, many=True, context={'request': request})
@@ -44,37 +75,119 @@ class UserViewSet(DjoserUserViewSet):
     )
     def subscribe(self, request, id):
         user = request.user
-        author = get_object_or_404(User, id=id)
-        request.data['id'] = id
-        serializer = SubscriptionsSerializer(
-            data=request.data, context={'request': request})
         if request.method == 'POST':
+            author = get_object_or_404(User, id=id)
+            if author == user:
+                raise non_field_error(
+                    SubscriptionsSerializer, 'self_subscribe')
             return post_func(
-                serializer, user=user, author=author)
+                SubscriptionsSerializer, request, user=user, author=author)
         elif request.method == 'DELETE':
             return delete_func(
-                serializer, Subscriptions, user=user, author=author)
+                SubscriptionsSerializer, User.objects.filter(id=id),
+                user=user, author_id=id)
         return Response(status=status.HTTP_400_BAD_REQUEST)
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class CachedListMixin:
+    cache_versions = ()
+
+    def list(self, request, *args, **kwargs):
+        return cached_response(
+            request, self.cache_versions,
+            lambda: super(CachedListMixin, self).list(
+                request, *args, **kwargs).data,
+            settings.REFERENCE_DATA_CACHE_TIMEOUT
+        )
+
+
+class TagViewSet(CachedListMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     pagination_class = None
+    cache_versions = ('tags',)
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(CachedListMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     filter_backends = (filters.DjangoFilterBackend,)
     filterset_class = FilterIngredient
     pagination_class = None
+    cache_versions = ('ingredients',)
+
+    @action(detail=False, methods=['get'], filter_backends=())
+    def autocomplete(self, request):
+        return cached_response(
+            request, self.cache_versions,
+            lambda: self.autocomplete_data(request),
+            settings.REFERENCE_DATA_CACHE_TIMEOUT,
+            name='ingredients-autocomplete'
+        )
+
+    def autocomplete_data(self, request):
+        name = request.query_params.get('name', '').strip()
+        limit = settings.INGREDIENTS_AUTOCOMPLETE_LIMIT
+        try:
+            limit = min(int(request.query_params['limit']), limit)
+        except (KeyError, ValueError):
+            pass
+        if not name or limit < 1:
+            return []
+        ingredients = Ingredient.objects.order_by(Lower('name'))
+        result = list(ingredients.name_matches('startswith', name)[:limit])
+        if len(result) < limit:
+            result.extend(ingredients.name_matches('contains', name).exclude(
+                id__in=[ingredient.id for ingredient in result]
+            )[:limit - len(result)])
+        return self.get_serializer(result, many=True).data
 
 
 class RecipeViewSet(viewsets.ModelViewSet):
     permission_classes = (AuthorOrStaffOrReadOnly,)
     filter_backends = (filters.DjangoFilterBackend,)
     filterset_class = FilterRecipe
+    parser_classes = (LimitedJSONParser, FormParser, MultiPartParser)
+    cache_versions = ('recipes', 'tags', 'ingredients')
+    cache_params = ('page', 'limit', 'cursor', 'tags', 'author', 'search',
+                    'ordering')
+
+    personal_params = ('is_favorited', 'is_in_shopping_cart')
+
+    def list(self, request, *args, **kwargs):
+        return self.cached(
+            request, super().list, 'recipes-list', self.cache_params,
+            *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached(
+            request, super().retrieve, 'recipes-detail', (),
+            *args, **kwargs)
+
+    def cached(self, request, view, name, params, *args, **kwargs):
+        user = request.user
+        if user.is_authenticated and any(
+                param in request.query_params
+                for param in self.personal_params):
+            return view(request, *args, **kwargs)
+
+        def build_data():
+            with as_anonymous(request):
+                return view(request, *args, **kwargs).data
+
+        personal_version = personalize_data = None
+        if user.is_authenticated:
+            sets, personal_version = get_user_sets(user)
+            name = f'{name}-personal'
+
+            def personalize_data(data):
+                return personalize(data, sets)
+
+        return cached_response(
+            request, self.cache_versions, build_data,
+            settings.RECIPES_CACHE_TIMEOUT, name=name, params=params,
+            personal_version=personal_version, personalize=personalize_data
+        )
 
     def get_serializer_class(self):
         if (self.request.method == 'POST'
@@ -83,28 +196,82 @@ class RecipeViewSet(viewsets.ModelViewSet):
         return RecipeSerializer
 
     def get_queryset(self):
-        queryset = Recipe.objects.prefetch_related(
-            'tags', 'recipeingredient_set'
-        ).all()
+        queryset = Recipe.objects.select_related(
+            'author'
+        ).prefetch_related(
+            'tags',
+            Prefetch(
+                'recipeingredient_set',
+                queryset=RecipeIngredient.objects.select_related(
+                    'ingredient')
+            )
+        ).with_user_flags(self.request.user)
         return queryset
 
+    @action(detail=False, methods=['get'])
+    def cookable(self, request):
+        data = {'ingredients': request.query_params.getlist('ingredients')}
+        if 'max_missing' in request.query_params:
+            data['max_missing'] = request.query_params['max_missing']
+        serializer = IngredientSetSerializer(data=data)
+        serializer.is_valid(raise_exception=True)
+        ranked = get_ingredient_index().match(**serializer.validated_data)
+        missing = dict(self.paginate_queryset(ranked))
+        recipes = self.get_queryset().in_bulk(missing)
+        page = []
+        for recipe_id, count in missing.items():
+            if recipe_id in recipes:
+                recipes[recipe_id].missing_ingredients = count
+                page.append(recipes[recipe_id])
+        serializer = CookableRecipeSerializer(
+            page, many=True, context=self.get_serializer_context())
+        return self.get_paginated_response(serializer.data)
+
+    @action(
+        detail=False,
+        methods=['get'],
+        permission_classes=(IsAuthenticated, ),
+        pagination_class=FeedPagination
+    )
+    def feed(self, request):
+        page = self.paginate_queryset(
+            self.get_queryset().feed(request.user))
+        serializer = RecipeSerializer(
+            page, many=True, context=self.get_serializer_context())
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=True, methods=['get'])
+    def similar(self, request, pk):
+        def build_data():
+            recipe = get_object_or_404(Recipe, id=pk)
+            recipes = Recipe.objects.filter(
+                similar_to__recipe=recipe
+            ).annotate(
+                score=F('similar_to__score')
+            ).order_by('-score', 'id')
+            return SimilarRecipeSerializer(
+                recipes, many=True, context=self.get_serializer_context()
+            ).data
+
+        return cached_response(
+            request, ('recipes', 'similar', f'similar:{pk}'), build_data,
+            settings.RECIPES_CACHE_TIMEOUT, name='recipes-similar')
+
     @action(
         detail=True,
         methods=['post', 'delete'],
         permission_classes=(IsAuthenticated, )
     )
     def favorite(self, request, pk):
-        recipe = get_object_or_404(Recipe, id=pk)
         user = request.user
-        request.data['id'] = recipe.id
-        serializer = FavoriteSerializer(
-            data=request.data, context={'request': request})
         if request.method == 'POST':
+            recipe = get_object_or_404(Recipe, id=pk)
             return post_func(
-                serializer, user=user, recipe=recipe)
+                FavoriteSerializer, request, user=user, recipe=recipe)
         elif request.method == 'DELETE':
             return delete_func(
-                serializer, Favorite, user=user, recipe=recipe)
+                FavoriteSerializer, Recipe.objects.filter(id=pk),
+                user=user, recipe_id=pk)
         return Response(status=status.HTTP_400_BAD_REQUEST)
 
     @action(
@@ -113,32 +280,88 @@ class RecipeViewSet(viewsets.ModelViewSet):
         permission_classes=(IsAuthenticated, )
     )
     def shopping_cart(self, request, pk):
-        recipe = get_object_or_404(Recipe, id=pk)
         user = request.user
-        request.data['id'] = recipe.id
-        serializer = ShoppingListSerializer(
-            data=request.data, context={'request': request})
         if request.method == 'POST':
+            recipe = get_object_or_404(Recipe, id=pk)
             return post_func(
-                serializer, user=user, recipe=recipe)
+                ShoppingListSerializer, request, user=user, recipe=recipe)
         elif request.method == 'DELETE':
             return delete_func(
-                serializer, ShoppingList, user=user, recipe=recipe)
+                ShoppingListSerializer, Recipe.objects.filter(id=pk),
+                user=user, recipe_id=pk)
         return Response(status=status.HTTP_400_BAD_REQUEST)
 
     @action(
         detail=False,
-        methods=['get'],
+        methods=['post', 'delete'],
+        permission_classes=(IsAuthenticated, )
+    )
+    def bulk_favorite(self, request):
+        return self.bulk_toggle(request, Favorite)
+
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
         permission_classes=(IsAuthenticated, )
     )
+    def bulk_shopping_cart(self, request):
+        return self.bulk_toggle(request, ShoppingList)
+
+    def bulk_toggle(self, request, model):
+        serializer = BulkRecipesSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        recipe_ids = serializer.validated_data['recipes']
+        found = set(Recipe.objects.filter(
+            id__in=recipe_ids).values_list('id', flat=True))
+        recipe_ids = [
+            recipe_id for recipe_id in recipe_ids if recipe_id in found]
+        if request.method == 'POST':
+            changed = model.objects.add_recipes(request.user, recipe_ids)
+            changed_status, unchanged_status = 'added', 'exists'
+        else:
+            changed = model.objects.remove_recipes(request.user, recipe_ids)
+            changed_status, unchanged_status = 'removed', 'missing'
+        changed = set(changed)
+        return Response({'results': [
+            {
+                'id': recipe_id,
+                'status': (
+                    'not_found' if recipe_id not in found
+                    else changed_status if recipe_id in changed
+                    else unchanged_status
+                ),
+            }
+            for recipe_id in serializer.validated_data['recipes']
+        ]})
+
+    @action(
+        detail=False,
+        methods=['get'],
+        permission_classes=(IsAuthenticated, ),
+        renderer_classes=(PlainTextRenderer, CSVRenderer, JSONRenderer)
+    )
     def download_shopping_cart(self, request):
         user = request.user
-        if not user.shopping_list_user.exists():
+        ingredients = user.shopping_list_ingredients.all()
+        signature = ingredients.aggregate(
+            rows=Count('id'),
+            total=Sum('amount'),
+            last_row=Max('id')
+        )
+        if not signature['rows']:
             return Response(status=status.HTTP_400_BAD_REQUEST)
-        ingredients = RecipeIngredient.objects.filter(
-            recipe__in_shopping_list__user=user
-        ).values(
+        renderer = request.accepted_renderer
+        etag = '"{}"'.format(hashlib.md5(
+            f'{renderer.format}:{user.get_full_name()}:'
+            f'{sorted(signature.items())}'.encode()
+        ).hexdigest())
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            not_modified['ETag'] = etag
+            return not_modified
+        ingredients = ingredients.values(
             'ingredient__name',
-            'ingredient__measurement_unit'
-        ).annotate(amount=Sum('amount'))
-        return create_shopping_list(user, ingredients)
+            'ingredient__measurement_unit',
+            'amount'
+        ).order_by('ingredient__name')
+        return create_shopping_list(user, ingredients, renderer, etag)
@@ -81,6 +81,22 @@ DATABASES = {
     }
 }
 
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
+REFERENCE_DATA_CACHE_TIMEOUT = 24 * 60 * 60
+
+RECIPES_CACHE_TIMEOUT = 10 * 60
+
+USER_SETS_CACHE_TIMEOUT = 60 * 60
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -138,14 +154,40 @@ REST_FRAMEWORK = {
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.IsAuthenticatedOrReadOnly",
     ],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.'
-                                'PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'api.pagination.'
+                                'PageNumberOrCursorPagination',
     'PAGE_SIZE': 6,
     'DEFAULT_FILTER_BACKENDS': (
         'django_filters.rest_framework.DjangoFilterBackend',
     )
 }
 
+SUBSCRIPTIONS_RECIPES_LIMIT = 10
+
+INGREDIENTS_AUTOCOMPLETE_LIMIT = 20
+
+BULK_RECIPES_LIMIT = 100
+
+COOKABLE_INGREDIENTS_LIMIT = 100
+
+SIMILAR_RECIPES_LIMIT = 10
+
+FEED_TIMELINE_MIN_AUTHORS = 200
+
+ASYNC_API_VIEWS = os.getenv('ASYNC_API_VIEWS', 'False') == 'True'
+
+RECIPE_IMAGES = {
+    'BACKEND': os.getenv(
+        'RECIPE_IMAGES_BACKEND', 'recipes.images.ThreadPoolBackend'),
+    'WORKERS': int(os.getenv('RECIPE_IMAGES_WORKERS', 2)),
+    'THUMBNAIL_SIZE': (600, 600),
+    'WEBP_QUALITY': 80,
+    'MAX_UPLOAD_BYTES': 10 * 1024 * 1024,
+    'MAX_REQUEST_BYTES': 14 * 1024 * 1024,
+    'MAX_PIXELS': 8000 * 5000,
+    'UPLOAD_SPOOL_SIZE': 1024 * 1024,
+}
+
 DJOSER = {
     'LOGIN_FIELD': 'email',
     'HIDE_USERS': False,
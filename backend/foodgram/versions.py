@@ -0,0 +1,21 @@
+import time
+
+from django.core.cache import cache
+
+
+def get_versions(names):
+    keys = [f'version:{name}' for name in names]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, time.time_ns(), None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def get_version(name):
+    return get_versions([name])[0]
+
+
+def bump_version(name):
+    cache.set(f'version:{name}', time.time_ns(), None)
@@ -1,8 +1,23 @@
 from django.contrib import admin
+from django.db import transaction
 
 from users.models import Subscriptions
 from .models import (Favorite, Ingredient, Recipe, RecipeIngredient,
-                     ShoppingList, Tag)
+                     ShoppingList, ShoppingListIngredient, Tag)
+from .similarity import schedule_similar_refresh
+
+
+def refresh_shopping_lists(recipe_ingredients):
+    ingredients_by_recipe = {}
+    for recipe_id, ingredient_id in recipe_ingredients:
+        ingredients_by_recipe.setdefault(recipe_id, set()).add(ingredient_id)
+
+    def refresh():
+        for recipe_id, ingredient_ids in ingredients_by_recipe.items():
+            ShoppingListIngredient.objects.refresh_recipe(
+                recipe_id, ingredient_ids)
+
+    transaction.on_commit(refresh)
 
 
 class FavoriteAdmin(admin.ModelAdmin):
@@ -25,9 +40,10 @@ class IngredientsToRecipe(admin.StackedInline):
 
 
 class RecipeAdmin(admin.ModelAdmin):
-    list_display = ('pk', 'name', 'author', 'count_favorites')
+    list_display = ('pk', 'name', 'author', 'count_favorites',
+                    'in_carts_count')
     list_editable = ('name', 'author')
-    readonly_fields = ('count_favorites', )
+    readonly_fields = ('count_favorites', 'in_carts_count')
     list_filter = ('name', 'author__username', 'tags__name')
     search_fields = ('name', 'author__username', 'tags__name')
     empty_value_display = '-пусто-'
@@ -35,8 +51,27 @@ class RecipeAdmin(admin.ModelAdmin):
         IngredientsToRecipe,
     ]
 
+    @admin.display(description='В избранном',
+                   ordering='favorites_count')
     def count_favorites(self, obj):
-        return obj.in_favorite.count()
+        return obj.favorites_count
+
+    def save_related(self, request, form, formsets, change):
+        recipe = form.instance
+        ingredient_ids = set(recipe.recipeingredient_set.values_list(
+            'ingredient_id', flat=True))
+        super().save_related(request, form, formsets, change)
+        ingredient_ids.update(recipe.recipeingredient_set.values_list(
+            'ingredient_id', flat=True))
+        for formset in formsets:
+            ingredient_ids.update(
+                inline.initial['ingredient']
+                for inline in formset.initial_forms
+                if inline.initial.get('ingredient')
+            )
+        refresh_shopping_lists(
+            (recipe.id, ingredient_id) for ingredient_id in ingredient_ids)
+        schedule_similar_refresh(recipe.id)
 
 
 class RecipeIngredientAdmin(admin.ModelAdmin):
@@ -44,6 +79,33 @@ class RecipeIngredientAdmin(admin.ModelAdmin):
     list_editable = ('recipe', 'ingredient', 'amount')
     empty_value_display = '-пусто-'
 
+    def save_model(self, request, obj, form, change):
+        previous = []
+        if change:
+            previous = list(RecipeIngredient.objects.filter(
+                pk=obj.pk).values_list('recipe_id', 'ingredient_id'))
+            refresh_shopping_lists(previous)
+        super().save_model(request, obj, form, change)
+        refresh_shopping_lists([(obj.recipe_id, obj.ingredient_id)])
+        schedule_similar_refresh(
+            obj.recipe_id,
+            *(recipe_id for recipe_id, _ in previous
+              if recipe_id != obj.recipe_id)
+        )
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        refresh_shopping_lists([(obj.recipe_id, obj.ingredient_id)])
+        schedule_similar_refresh(obj.recipe_id)
+
+    def delete_queryset(self, request, queryset):
+        recipe_ingredients = list(
+            queryset.values_list('recipe_id', 'ingredient_id'))
+        super().delete_queryset(request, queryset)
+        refresh_shopping_lists(recipe_ingredients)
+        schedule_similar_refresh(
+            *{recipe_id for recipe_id, _ in recipe_ingredients})
+
 
 class ShoppingCartAdmin(admin.ModelAdmin):
     list_display = ('pk', 'user', 'recipe')
@@ -0,0 +1,116 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait
+from io import BytesIO
+from pathlib import Path
+from threading import Lock
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from django.utils.module_loading import import_string
+from PIL import Image
+
+from foodgram.versions import bump_version
+
+from .models import Recipe
+
+logger = logging.getLogger(__name__)
+
+
+class SyncBackend:
+
+    def __init__(self, options):
+        pass
+
+    def submit(self, func, *args):
+        func(*args)
+
+    def wait(self):
+        pass
+
+
+class ThreadPoolBackend:
+
+    def __init__(self, options):
+        self.executor = ThreadPoolExecutor(
+            max_workers=options['WORKERS'],
+            thread_name_prefix='recipe-images'
+        )
+        self.pending = set()
+        self.lock = Lock()
+
+    def submit(self, func, *args):
+        future = self.executor.submit(self.run, func, *args)
+        with self.lock:
+            self.pending.add(future)
+        future.add_done_callback(self.done)
+
+    def run(self, func, *args):
+        try:
+            func(*args)
+        except Exception:
+            logger.exception('Ошибка фоновой обработки рецепта.')
+        finally:
+            connection.close()
+
+    def done(self, future):
+        with self.lock:
+            self.pending.discard(future)
+
+    def wait(self):
+        with self.lock:
+            pending = list(self.pending)
+        wait(pending)
+
+
+BACKENDS = {}
+BACKENDS_LOCK = Lock()
+
+
+def get_backend():
+    path = settings.RECIPE_IMAGES['BACKEND']
+    with BACKENDS_LOCK:
+        if path not in BACKENDS:
+            BACKENDS[path] = import_string(path)(settings.RECIPE_IMAGES)
+        return BACKENDS[path]
+
+
+def encode_webp(image, size=None):
+    image = image.copy()
+    if size:
+        image.thumbnail(size)
+    buffer = BytesIO()
+    image.save(
+        buffer, 'WEBP', quality=settings.RECIPE_IMAGES['WEBP_QUALITY'])
+    return buffer.getvalue()
+
+
+def process_recipe_image(recipe_id):
+    recipe = Recipe.objects.filter(pk=recipe_id).only('image').first()
+    if recipe is None or not recipe.image:
+        return
+    original = recipe.image.name
+    with recipe.image.open('rb') as file, Image.open(file) as image:
+        image.load()
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA')
+        full = encode_webp(image)
+        thumbnail = encode_webp(
+            image, settings.RECIPE_IMAGES['THUMBNAIL_SIZE'])
+    stem = Path(original).stem
+    recipe.image_webp.save(f'{stem}.webp', ContentFile(full), save=False)
+    recipe.thumbnail.save(f'{stem}.webp', ContentFile(thumbnail), save=False)
+    updated = Recipe.objects.filter(pk=recipe_id, image=original).update(
+        image_webp=recipe.image_webp.name,
+        thumbnail=recipe.thumbnail.name
+    )
+    if not updated:
+        recipe.image_webp.delete(save=False)
+        recipe.thumbnail.delete(save=False)
+        return
+    bump_version('recipes')
+
+
+def schedule_image_processing(recipe_id):
+    transaction.on_commit(
+        lambda: get_backend().submit(process_recipe_image, recipe_id))
@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from recipes.models import TimelineEntry
+
+
+class Command(BaseCommand):
+
+    help = ('Пересоздание лент подписок для пользователей, подписанных '
+            'не менее чем на FEED_TIMELINE_MIN_AUTHORS авторов.')
+
+    def handle(self, *args, **options):
+        TimelineEntry.objects.rebuild()
+        users = TimelineEntry.objects.values('user').distinct().count()
+        self.stdout.write(self.style.SUCCESS(
+            f'Ленты пересозданы для {users} пользователей '
+            f'(порог {settings.FEED_TIMELINE_MIN_AUTHORS} авторов), '
+            f'записей: {TimelineEntry.objects.count()}.'))
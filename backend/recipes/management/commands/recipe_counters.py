@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+
+    help = ('Сверка счётчиков избранного и списков покупок рецептов '
+            'с фактическими данными.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            dest='verify',
+            default=False,
+            help='Только вывести расхождения, не исправляя их.',
+        )
+
+    def handle(self, *args, **options):
+        drifted = Recipe.objects.drifted_counters().values_list(
+            'id', 'favorites_count', 'live_favorites_count',
+            'in_carts_count', 'live_in_carts_count'
+        ).order_by('id')
+        differences = list(drifted)
+        for recipe, favorites, live_favorites, carts, live_carts in (
+            differences
+        ):
+            self.stdout.write(
+                f'Рецепт {recipe}: в избранном {favorites} '
+                f'(фактически {live_favorites}), в списках покупок {carts} '
+                f'(фактически {live_carts})')
+        if options['verify']:
+            if differences:
+                raise CommandError(
+                    f'Расхождений в счётчиках: {len(differences)}.')
+            self.stdout.write(self.style.SUCCESS(
+                'Счётчики рецептов совпадают с данными.'))
+            return
+        updated = Recipe.objects.reconcile_counters()
+        self.stdout.write(self.style.SUCCESS(
+            f'Исправлено счётчиков рецептов: {updated}.'))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.models import ShoppingListIngredient
+
+
+class Command(BaseCommand):
+
+    help = ('Пересборка и проверка сводных списков покупок '
+            'пользователей.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            dest='verify',
+            default=False,
+            help='Только сравнить сводные списки с данными рецептов.',
+        )
+
+    def handle(self, *args, **options):
+        if not options['verify']:
+            ShoppingListIngredient.objects.rebuild()
+            self.stdout.write(self.style.SUCCESS(
+                'Сводные списки покупок пересобраны.'))
+        differences = list(ShoppingListIngredient.objects.differences())
+        for (user, ingredient), stored, actual in differences:
+            self.stdout.write(
+                f'Пользователь {user}, ингредиент {ingredient}: '
+                f'в сводном списке {stored}, по рецептам {actual}')
+        if differences:
+            raise CommandError(
+                f'Расхождений в сводных списках: {len(differences)}.')
+        self.stdout.write(self.style.SUCCESS(
+            'Сводные списки покупок совпадают с данными рецептов.'))
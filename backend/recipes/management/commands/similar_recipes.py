@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipes.similarity import rebuild_similar, refresh_similar
+
+
+class Command(BaseCommand):
+
+    help = ('Расчёт похожих рецептов по сходству Жаккара наборов '
+            'ингредиентов и тегов.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--recipes',
+            type=int,
+            nargs='+',
+            help='Пересчитать только указанные рецепты и рецепты, '
+                 'в подборках которых они могут появиться или исчезнуть.',
+        )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        if options['recipes']:
+            count = len(refresh_similar(options['recipes']))
+        else:
+            count = rebuild_similar()
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересчитаны похожие рецепты для {count} рецептов за '
+            f'{time.perf_counter() - start:.2f} с.'))
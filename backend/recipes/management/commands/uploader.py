@@ -1,14 +1,39 @@
 import csv
+import json
+import time
+from itertools import islice
+from pathlib import Path
 
 from django.conf import settings
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 
+from foodgram.versions import bump_version
 from recipes.models import Ingredient
 
 
+class DryRunRollback(Exception):
+    pass
+
+
+def read_csv(file):
+    return csv.reader(file)
+
+
+def read_json(file):
+    for item in json.load(file):
+        yield item.get('name'), item.get('measurement_unit')
+
+
+READERS = {
+    '.csv': read_csv,
+    '.json': read_json,
+}
+
+
 class Command(BaseCommand):
 
-    help = 'Удаление/запись данных из csv в базу данных.'
+    help = 'Удаление/запись данных из csv или json в базу данных.'
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -18,24 +43,97 @@ class Command(BaseCommand):
             default=False,
             help='Удаление/запись данных из csv в базу данных.',
         )
+        parser.add_argument(
+            '--file',
+            type=Path,
+            default=settings.DATA_DIR / 'ingredients.csv',
+            help='Файл с ингредиентами в формате csv или json.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Количество записей, добавляемых одним запросом.',
+        )
+        parser.add_argument(
+            '--upsert',
+            action='store_true',
+            default=False,
+            help='Не загружать имеющиеся ингредиенты в память, а '
+                 'пропускать совпадения средствами базы данных.',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            default=False,
+            help='Выполнить загрузку без сохранения изменений.',
+        )
 
     def handle(self, *args, **options):
         if options['delete_existing']:
             Ingredient.objects.all().delete()
+            bump_version('ingredients')
             self.stdout.write(self.style.SUCCESS('БД очищена.'))
+            return
+        path = options['file']
+        reader = READERS.get(path.suffix.lower())
+        if reader is None:
+            raise CommandError(
+                f'Неподдерживаемый формат файла {path.name}, '
+                f'ожидается csv или json.')
+        self.path = path
+        self.read = 0
+        start = time.perf_counter()
+        try:
+            with transaction.atomic(), open(path, encoding='utf-8') as file:
+                before = Ingredient.objects.count()
+                self.upload(reader(file), options)
+                self.created = Ingredient.objects.count() - before
+                if options['dry_run']:
+                    raise DryRunRollback
+        except DryRunRollback:
+            pass
+        else:
+            bump_version('ingredients')
+        self.print_stats(time.perf_counter() - start, options['dry_run'])
+
+    def upload(self, rows, options):
+        if options['upsert']:
+            seen = set()
         else:
-            with open(settings.DATA_DIR / 'ingredients.csv',
-                      'r', encoding='utf-8') as file:
-                reader = list(csv.reader(file))
-                for i in range(len(reader)):
-                    try:
-                        Ingredient.objects.get_or_create(
-                            name=reader[i][0],
-                            measurement_unit=reader[i][1]
-                        )
-                    except Exception as err:
-                        print(
-                            f'Строка {i + 1} {reader[i]} из файла'
-                            f' ingredients.csv не была загружена'
-                            f' в БД. Ошибка: {err}')
-            print('Загрузка данных в базу завершена.')
+            seen = set(Ingredient.objects.values_list(
+                'name', 'measurement_unit').iterator())
+        new = (
+            Ingredient(name=name, measurement_unit=measurement_unit)
+            for name, measurement_unit in self.unique(rows, seen)
+        )
+        while True:
+            batch = list(islice(new, options['batch_size']))
+            if not batch:
+                break
+            Ingredient.objects.bulk_create(
+                batch, ignore_conflicts=options['upsert'])
+
+    def unique(self, rows, seen):
+        for row in rows:
+            self.read += 1
+            if len(row) != 2 or not all(row):
+                self.stdout.write(
+                    f'Строка {self.read} {row} из файла {self.path.name}'
+                    f' не была загружена в БД. Ошибка: ожидаются '
+                    f'название и единица измерения.')
+                continue
+            key = (row[0].strip(), row[1].strip())
+            if key in seen:
+                continue
+            seen.add(key)
+            yield key
+
+    def print_stats(self, elapsed, dry_run):
+        speed = self.read / elapsed if elapsed else 0
+        prefix = 'Пробная загрузка' if dry_run else 'Загрузка данных в базу'
+        self.stdout.write(self.style.SUCCESS(
+            f'{prefix} завершена за {elapsed:.2f} с: '
+            f'прочитано {self.read}, добавлено {self.created}, '
+            f'пропущено {self.read - self.created} '
+            f'({speed:.0f} строк/с).'))
@@ -0,0 +1,125 @@
+from array import array
+from collections import Counter
+from threading import Lock
+
+from django.core.cache import cache
+from django.db import transaction
+
+from foodgram.versions import bump_version, get_version
+
+from .models import RecipeIngredient
+
+INDEX = {}
+INDEX_LOCK = Lock()
+INDEX_VERSION = 'recipe-ingredients'
+DELTAS_KEY = f'{INDEX_VERSION}:deltas'
+DELTAS_TIMEOUT = 24 * 60 * 60
+DELTAS_LIMIT = 1000
+
+
+def get_sequence():
+    cache.add(DELTAS_KEY, 0, None)
+    return cache.get(DELTAS_KEY, 0)
+
+
+class IngredientIndex:
+
+    def __init__(self, version):
+        self.version = version
+        self.sequence = get_sequence()
+        self.postings = {}
+        rows = RecipeIngredient.objects.order_by().values_list(
+            'ingredient_id', 'recipe_id')
+        for ingredient_id, recipe_id in rows.iterator(chunk_size=10000):
+            postings = self.postings.get(ingredient_id)
+            if postings is None:
+                postings = self.postings[ingredient_id] = array('I')
+            postings.append(recipe_id)
+        sizes = Counter()
+        for postings in self.postings.values():
+            sizes.update(postings)
+        self.sizes = array('H', bytes(2 * (max(sizes, default=0) + 1)))
+        for recipe_id, size in sizes.items():
+            self.sizes[recipe_id] = size
+
+    def add(self, recipe_id, ingredient_id):
+        postings = self.postings.get(ingredient_id, array('I'))
+        if recipe_id in postings:
+            return
+        if recipe_id >= len(self.sizes):
+            self.sizes.extend(bytes(2 * (recipe_id + 1 - len(self.sizes))))
+        self.postings[ingredient_id] = postings + array('I', [recipe_id])
+        self.sizes[recipe_id] += 1
+
+    def remove(self, recipe_id, ingredient_id):
+        postings = self.postings.get(ingredient_id, ())
+        if recipe_id not in postings:
+            return
+        self.postings[ingredient_id] = array(
+            'I', (item for item in postings if item != recipe_id))
+        self.sizes[recipe_id] -= 1
+
+    def apply(self, deltas):
+        for recipe_id, added, removed in deltas:
+            for ingredient_id in removed:
+                self.remove(recipe_id, ingredient_id)
+            for ingredient_id in added:
+                self.add(recipe_id, ingredient_id)
+
+    def catch_up(self, sequence):
+        if not self.sequence < sequence <= self.sequence + DELTAS_LIMIT:
+            return False
+        keys = [f'{DELTAS_KEY}:{number}'
+                for number in range(self.sequence + 1, sequence + 1)]
+        deltas = cache.get_many(keys)
+        if len(deltas) != len(keys):
+            return False
+        self.apply(deltas[key] for key in keys)
+        self.sequence = sequence
+        return True
+
+    def match(self, ingredients, max_missing=None):
+        matched = Counter()
+        for ingredient_id in set(ingredients):
+            matched.update(self.postings.get(ingredient_id, ()))
+        ranked = (
+            (self.sizes[recipe_id] - count, -count, -recipe_id)
+            for recipe_id, count in matched.items()
+        )
+        if max_missing is not None:
+            ranked = (item for item in ranked if item[0] <= max_missing)
+        return [(-recipe_id, missing)
+                for missing, _, recipe_id in sorted(ranked)]
+
+
+def publish_delta(recipe_id, added=(), removed=()):
+    cache.add(DELTAS_KEY, 0, None)
+    try:
+        sequence = cache.incr(DELTAS_KEY)
+    except ValueError:
+        bump_version(INDEX_VERSION)
+        return
+    cache.set(f'{DELTAS_KEY}:{sequence}',
+              (recipe_id, tuple(added), tuple(removed)), DELTAS_TIMEOUT)
+
+
+def recipe_ingredients_changed(recipe_id, added=(), removed=()):
+    if added or removed:
+        transaction.on_commit(
+            lambda: publish_delta(recipe_id, added, removed))
+
+
+def get_ingredient_index():
+    version = get_version(INDEX_VERSION)
+    sequence = get_sequence()
+    index = INDEX.get('ingredients')
+    if (index is not None and index.version == version
+            and index.sequence == sequence):
+        return index
+    with INDEX_LOCK:
+        index = INDEX.get('ingredients')
+        if index is None or index.version != version:
+            index = INDEX['ingredients'] = IngredientIndex(version)
+        elif index.sequence != sequence and not index.catch_up(sequence):
+            index = INDEX['ingredients'] = IngredientIndex(version)
+        return index
@@ -0,0 +1,67 @@
+# Generated by Django 3.2.16 on 2026-10-18 02:06
+
+from django.db import migrations, models
+
+
+def merge_duplicate_ingredients(apps, schema_editor):
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    RecipeIngredient = apps.get_model('recipes', 'RecipeIngredient')
+    ShoppingListIngredient = apps.get_model(
+        'recipes', 'ShoppingListIngredient')
+    duplicates = Ingredient.objects.values(
+        'name', 'measurement_unit'
+    ).annotate(
+        count=models.Count('id'), keep=models.Min('id')
+    ).filter(count__gt=1).order_by()
+    if not duplicates:
+        return
+    for duplicate in duplicates:
+        keep = duplicate['keep']
+        extra = Ingredient.objects.filter(
+            name=duplicate['name'],
+            measurement_unit=duplicate['measurement_unit']
+        ).exclude(id=keep)
+        for item in RecipeIngredient.objects.filter(ingredient__in=extra):
+            kept = RecipeIngredient.objects.filter(
+                recipe_id=item.recipe_id, ingredient_id=keep).first()
+            if kept is None:
+                item.ingredient_id = keep
+                item.save()
+            else:
+                kept.amount += item.amount
+                kept.save()
+                item.delete()
+        extra.delete()
+    ShoppingListIngredient.objects.all().delete()
+    totals = RecipeIngredient.objects.filter(
+        recipe__in_shopping_list__isnull=False
+    ).values(
+        'ingredient', user=models.F('recipe__in_shopping_list__user')
+    ).annotate(total=models.Sum('amount')).order_by()
+    ShoppingListIngredient.objects.bulk_create(
+        (
+            ShoppingListIngredient(
+                user_id=row['user'],
+                ingredient_id=row['ingredient'],
+                amount=row['total']
+            )
+            for row in totals.iterator()
+        ),
+        batch_size=5000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_shoppinglistingredient'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            merge_duplicate_ingredients, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('name', 'measurement_unit'), name='unique_ingredient'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+from django.db import migrations
+
+POSTGRES_INDEXES = (
+    'CREATE INDEX IF NOT EXISTS recipes_ingredient_lower_name_idx '
+    'ON recipes_ingredient (lower(name) text_pattern_ops)',
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX IF NOT EXISTS recipes_ingredient_name_trgm_idx '
+    'ON recipes_ingredient USING gin (lower(name) gin_trgm_ops)',
+)
+DEFAULT_INDEXES = (
+    'CREATE INDEX IF NOT EXISTS recipes_ingredient_lower_name_idx '
+    'ON recipes_ingredient (lower(name))',
+)
+DROP_INDEXES = (
+    'DROP INDEX IF EXISTS recipes_ingredient_lower_name_idx',
+    'DROP INDEX IF EXISTS recipes_ingredient_name_trgm_idx',
+)
+
+
+def create_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        statements = POSTGRES_INDEXES
+    else:
+        statements = DEFAULT_INDEXES
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def drop_indexes(apps, schema_editor):
+    for statement in DROP_INDEXES:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_ingredient_unique'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
@@ -1,7 +1,26 @@
+import re
+
+from django.conf import settings
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVectorField)
 from django.core.validators import MinValueValidator
-from django.db import models
+from django.db import connections, models, transaction
+from django.db.models import (Case, Count, Exists, F, FloatField, OuterRef, Q,
+                              Subquery, Sum, Value, When)
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Coalesce, Greatest, Lower
+from django.dispatch import Signal
+
+from users.models import Subscriptions, User
+
+
+class IngredientQuerySet(models.QuerySet):
 
-from users.models import User
+    def name_matches(self, lookup, value):
+        if connections[self.db].vendor == 'postgresql':
+            return self.annotate(lower_name=Lower('name')).filter(
+                **{f'lower_name__{lookup}': value.lower()})
+        return self.filter(**{f'name__i{lookup}': value})
 
 
 class Ingredient(models.Model):
@@ -14,7 +33,11 @@ class Ingredient(models.Model):
         verbose_name='Единицы измерения'
     )
 
+    objects = IngredientQuerySet.as_manager()
+
     class Meta:
+        constraints = [models.UniqueConstraint(
+            fields=['name', 'measurement_unit'], name='unique_ingredient')]
         ordering = ('name',)
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
@@ -51,6 +74,118 @@ class Tag(models.Model):
         return self.name
 
 
+SEARCH_TERM = re.compile(r'\w+')
+SEARCH_MAX_TERMS = 10
+SEARCH_CONFIG = 'russian'
+FTS_RANK = '-bm25(recipes_recipe_fts, 10.0, 1.0)'
+
+
+class RecipeQuerySet(models.QuerySet):
+
+    def with_user_flags(self, user):
+        if user.is_anonymous:
+            return self.annotate(
+                is_favorited=Value(False),
+                is_in_shopping_cart=Value(False)
+            )
+        return self.annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+            is_in_shopping_cart=Exists(ShoppingList.objects.filter(
+                user=user, recipe=OuterRef('pk')))
+        )
+
+    def limited_per_author(self, limit):
+        if limit < 1:
+            return self.none()
+        boundary = self.model.objects.filter(
+            author=OuterRef('author')
+        ).order_by('-id').values('id')[limit - 1:limit]
+        return self.filter(id__gte=Coalesce(Subquery(boundary), Value(0)))
+
+    def change_counter(self, counter, delta):
+        value = F(counter) + delta
+        if delta < 0:
+            value = Greatest(value, 0)
+        return self.update(**{counter: value})
+
+    def drifted_counters(self):
+        return self.annotate(
+            live_favorites_count=self.count_subquery(Favorite),
+            live_in_carts_count=self.count_subquery(ShoppingList)
+        ).exclude(
+            favorites_count=F('live_favorites_count'),
+            in_carts_count=F('live_in_carts_count')
+        )
+
+    def refresh_counters(self):
+        return self.update(
+            favorites_count=self.count_subquery(Favorite),
+            in_carts_count=self.count_subquery(ShoppingList)
+        )
+
+    def reconcile_counters(self):
+        return self.model.objects.filter(
+            id__in=list(self.drifted_counters().values_list('id', flat=True))
+        ).refresh_counters()
+
+    def feed(self, user):
+        if TimelineEntry.objects.uses_timeline(user.id):
+            return self.filter(timeline_entries__user=user)
+        return self.filter(author__in=Subscriptions.objects.filter(
+            user=user).values('author'))
+
+    def search(self, query):
+        terms = SEARCH_TERM.findall(query.lower())[:SEARCH_MAX_TERMS]
+        if not terms:
+            return self.none()
+        search = getattr(
+            self, f'{connections[self.db].vendor}_search', self.default_search)
+        return search(terms).order_by('-search_rank', '-id')
+
+    def postgresql_search(self, terms):
+        query = SearchQuery(
+            ' & '.join(f'{term}:*' for term in terms),
+            config=SEARCH_CONFIG,
+            search_type='raw'
+        )
+        vector = RawSQL('recipes_recipe.search_vector', [],
+                        output_field=SearchVectorField())
+        return self.alias(search_vector=vector).filter(
+            search_vector=query
+        ).annotate(search_rank=SearchRank(vector, query))
+
+    def sqlite_search(self, terms):
+        match = ' '.join(f'"{term}"*' for term in terms)
+        return self.extra(
+            tables=['recipes_recipe_fts'],
+            where=['recipes_recipe_fts.rowid = recipes_recipe.id',
+                   'recipes_recipe_fts MATCH %s'],
+            params=[match],
+            select={'search_rank': FTS_RANK}
+        )
+
+    def default_search(self, terms):
+        condition = Q()
+        for term in terms:
+            condition &= Q(name__icontains=term) | Q(text__icontains=term)
+        return self.filter(condition).annotate(search_rank=Case(
+            When(name__icontains=terms[0], then=Value(1.0)),
+            default=Value(0.0),
+            output_field=FloatField()
+        ))
+
+    @staticmethod
+    def count_subquery(model):
+        return Coalesce(Subquery(
+            model.objects.filter(
+                recipe=OuterRef('pk')
+            ).order_by().values('recipe').annotate(
+                count=Count('id')
+            ).values('count')
+        ), 0)
+
+
 class Recipe(models.Model):
     author = models.ForeignKey(
         User,
@@ -67,6 +202,18 @@ class Recipe(models.Model):
         upload_to='recipes/',
         verbose_name='Фото рецепта'
     )
+    image_webp = models.ImageField(
+        upload_to='recipes/webp/',
+        blank=True,
+        editable=False,
+        verbose_name='Фото рецепта в WebP'
+    )
+    thumbnail = models.ImageField(
+        upload_to='recipes/thumbnails/',
+        blank=True,
+        editable=False,
+        verbose_name='Миниатюра фото рецепта'
+    )
     text = models.TextField(
         verbose_name='Описание рецепта'
     )
@@ -84,8 +231,28 @@ class Recipe(models.Model):
         validators=(MinValueValidator(1), ),
         verbose_name='Время приготовления в минутах',
     )
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В избранном'
+    )
+    in_carts_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В списках покупок'
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
+        indexes = [
+            models.Index(fields=['author', '-id'],
+                         name='recipe_author_recent_idx'),
+            models.Index(
+                fields=['-favorites_count', '-in_carts_count', '-id'],
+                name='recipe_popular_idx'
+            ),
+        ]
         ordering = ('-id',)
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
@@ -136,6 +303,8 @@ class RecipeTag(models.Model):
     class Meta:
         constraints = [models.UniqueConstraint(fields=['tag', 'recipe'],
                                                name='unique_recipe_tag')]
+        indexes = [models.Index(fields=['recipe', 'tag'],
+                                name='recipe_tag_recipe_idx')]
         verbose_name = 'Тег рецепта'
         verbose_name_plural = 'Теги рецепта'
 
@@ -143,6 +312,74 @@ class RecipeTag(models.Model):
         return f'Тег {self.tag.name} рецепта {self.recipe.name}'
 
 
+user_recipes_changed = Signal()
+
+
+class UserRecipeQuerySet(models.QuerySet):
+
+    def add_recipes(self, user, recipe_ids):
+        with transaction.atomic():
+            existing = set(self.filter(
+                user=user, recipe_id__in=recipe_ids
+            ).values_list('recipe_id', flat=True))
+            added = [
+                recipe_id for recipe_id in recipe_ids
+                if recipe_id not in existing
+            ]
+            self.bulk_create(
+                (self.model(user=user, recipe_id=recipe_id)
+                 for recipe_id in added),
+                ignore_conflicts=True
+            )
+            self.recipes_changed(user, added)
+        return added
+
+    def remove_recipes(self, user, recipe_ids):
+        with transaction.atomic():
+            removed = list(self.filter(
+                user=user, recipe_id__in=recipe_ids
+            ).values_list('recipe_id', flat=True))
+            if removed:
+                self.delete_rows(user, removed)
+            self.recipes_changed(user, removed)
+        return removed
+
+    def delete_rows(self, user, recipe_ids):
+        connection = connections[self.db]
+        quote_name = connection.ops.quote_name
+        options = self.model._meta
+        placeholders = ', '.join(['%s'] * len(recipe_ids))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {quote_name(options.db_table)} '
+                f'WHERE {quote_name(options.get_field("user").column)} = %s '
+                f'AND {quote_name(options.get_field("recipe").column)} '
+                f'IN ({placeholders})',
+                [user.id, *recipe_ids]
+            )
+
+    def recipes_changed(self, user, recipe_ids):
+        if recipe_ids:
+            Recipe.objects.filter(id__in=recipe_ids).refresh_counters()
+            user_recipes_changed.send(
+                sender=self.model, user=user, recipe_ids=recipe_ids)
+
+
+class ShoppingListQuerySet(UserRecipeQuerySet):
+
+    def recipes_changed(self, user, recipe_ids):
+        super().recipes_changed(user, recipe_ids)
+        if not recipe_ids:
+            return
+        ingredient_ids = list(RecipeIngredient.objects.filter(
+            recipe_id__in=recipe_ids
+        ).values_list('ingredient_id', flat=True).distinct())
+        transaction.on_commit(
+            lambda: ShoppingListIngredient.objects.refresh(
+                [user.id], ingredient_ids)
+        )
+
+
 class Favorite(models.Model):
     user = models.ForeignKey(
         User,
@@ -157,6 +394,8 @@ class Favorite(models.Model):
         verbose_name='Рецепт'
     )
 
+    objects = UserRecipeQuerySet.as_manager()
+
     class Meta:
         constraints = [models.UniqueConstraint(
             fields=['user', 'recipe'],
@@ -184,6 +423,8 @@ class ShoppingList(models.Model):
         verbose_name='Рецепт'
     )
 
+    objects = ShoppingListQuerySet.as_manager()
+
     class Meta:
         constraints = [models.UniqueConstraint(
             fields=['user', 'recipe'],
@@ -195,3 +436,229 @@ class ShoppingList(models.Model):
 
     def __str__(self):
         return f'{self.user.username} - {self.recipe.name}'
+
+
+class ShoppingListIngredientQuerySet(models.QuerySet):
+
+    def live_totals(self, **filters):
+        return RecipeIngredient.objects.filter(
+            recipe__in_shopping_list__isnull=False, **filters
+        ).values(
+            'ingredient', user=F('recipe__in_shopping_list__user')
+        ).annotate(total=Sum('amount')).order_by()
+
+    def refresh(self, user_ids, ingredient_ids):
+        user_ids, ingredient_ids = set(user_ids), set(ingredient_ids)
+        if not user_ids or not ingredient_ids:
+            return
+        with transaction.atomic():
+            list(User.objects.select_for_update().filter(
+                id__in=user_ids).order_by('id').values_list('id'))
+            self.filter(
+                user__in=user_ids, ingredient__in=ingredient_ids).delete()
+            self.bulk_create(
+                self.model(
+                    user_id=row['user'],
+                    ingredient_id=row['ingredient'],
+                    amount=row['total']
+                )
+                for row in self.live_totals(
+                    recipe__in_shopping_list__user__in=user_ids,
+                    ingredient__in=ingredient_ids
+                )
+            )
+
+    def refresh_recipe(self, recipe_id, ingredient_ids):
+        user_ids = ShoppingList.objects.filter(
+            recipe_id=recipe_id).values_list('user_id', flat=True)
+        self.refresh(user_ids, ingredient_ids)
+
+    def rebuild(self):
+        with transaction.atomic():
+            self.all().delete()
+            self.bulk_create(
+                (
+                    self.model(
+                        user_id=row['user'],
+                        ingredient_id=row['ingredient'],
+                        amount=row['total']
+                    )
+                    for row in self.live_totals().iterator()
+                ),
+                batch_size=5000
+            )
+
+    def differences(self):
+        stored = {
+            (user, ingredient): amount
+            for user, ingredient, amount in self.values_list(
+                'user', 'ingredient', 'amount').iterator()
+        }
+        for row in self.live_totals().iterator():
+            key = (row['user'], row['ingredient'])
+            amount = stored.pop(key, None)
+            if amount != row['total']:
+                yield key, amount, row['total']
+        for key, amount in stored.items():
+            yield key, amount, None
+
+
+class ShoppingListIngredient(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_ingredients',
+        verbose_name='Пользователь'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        verbose_name='Ингредиент'
+    )
+    amount = models.PositiveIntegerField(
+        verbose_name='Количество'
+    )
+
+    objects = ShoppingListIngredientQuerySet.as_manager()
+
+    class Meta:
+        constraints = [models.UniqueConstraint(
+            fields=['user', 'ingredient'],
+            name='unique_shopping_list_ingredient'
+        )]
+        verbose_name = 'Ингредиент в списке покупок'
+        verbose_name_plural = 'Ингредиенты в списках покупок'
+
+    def __str__(self):
+        return f'{self.user.username} - {self.ingredient.name}'
+
+
+class SimilarRecipe(models.Model):
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='similar_recipes',
+        verbose_name='Рецепт'
+    )
+    similar = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='similar_to',
+        verbose_name='Похожий рецепт'
+    )
+    score = models.FloatField(verbose_name='Сходство')
+
+    class Meta:
+        constraints = [models.UniqueConstraint(
+            fields=['recipe', 'similar'], name='unique_similar_recipe')]
+        ordering = ('-score',)
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+
+    def __str__(self):
+        return f'{self.recipe.name} - {self.similar.name}'
+
+
+class TimelineEntryQuerySet(models.QuerySet):
+
+    @staticmethod
+    def authors_count(user):
+        return Subquery(Subscriptions.objects.filter(
+            user=user
+        ).order_by().values('user').annotate(
+            count=Count('id')
+        ).values('count'))
+
+    def uses_timeline(self, user_id):
+        return User.objects.filter(id=user_id).annotate(
+            authors=self.authors_count(OuterRef('pk'))
+        ).filter(
+            Exists(self.model.objects.filter(user=OuterRef('pk'))),
+            authors__gte=settings.FEED_TIMELINE_MIN_AUTHORS
+        ).exists()
+
+    @staticmethod
+    def heavy_followers():
+        return Subscriptions.objects.order_by().values('user').annotate(
+            authors=Count('id')
+        ).filter(
+            authors__gte=settings.FEED_TIMELINE_MIN_AUTHORS
+        ).values('user')
+
+    def fill(self, subscriptions):
+        self.bulk_create(
+            (
+                self.model(user_id=user_id, recipe_id=recipe_id)
+                for user_id, recipe_id in subscriptions.filter(
+                    author__recipes__isnull=False
+                ).values_list('user', 'author__recipes').iterator()
+            ),
+            batch_size=5000,
+            ignore_conflicts=True
+        )
+
+    def rebuild(self):
+        with transaction.atomic():
+            self.all().delete()
+            self.fill(Subscriptions.objects.filter(
+                user__in=self.heavy_followers()))
+
+    def publish(self, recipe_id, author_id):
+        followers = Subscriptions.objects.filter(
+            author_id=author_id
+        ).annotate(
+            authors=self.authors_count(OuterRef('user'))
+        ).filter(
+            Exists(self.model.objects.filter(user=OuterRef('user'))),
+            authors__gte=settings.FEED_TIMELINE_MIN_AUTHORS
+        ).values_list('user', flat=True)
+        self.bulk_create(
+            (
+                self.model(user_id=user_id, recipe_id=recipe_id)
+                for user_id in followers.iterator()
+            ),
+            batch_size=5000,
+            ignore_conflicts=True
+        )
+
+    def subscribed(self, user_id, author_id):
+        subscriptions = Subscriptions.objects.filter(user_id=user_id)
+        if subscriptions.count() < settings.FEED_TIMELINE_MIN_AUTHORS:
+            return
+        if self.filter(user_id=user_id).exists():
+            subscriptions = subscriptions.filter(author_id=author_id)
+        self.fill(subscriptions)
+
+    def unsubscribed(self, user_id, author_id):
+        count = Subscriptions.objects.filter(user_id=user_id).count()
+        entries = self.filter(user_id=user_id)
+        if count >= settings.FEED_TIMELINE_MIN_AUTHORS:
+            entries.filter(recipe__author_id=author_id).delete()
+        elif count == settings.FEED_TIMELINE_MIN_AUTHORS - 1:
+            entries.delete()
+
+
+class TimelineEntry(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Пользователь'
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Рецепт'
+    )
+
+    objects = TimelineEntryQuerySet.as_manager()
+
+    class Meta:
+        constraints = [models.UniqueConstraint(
+            fields=['user', 'recipe'], name='unique_timeline_entry')]
+        verbose_name = 'Запись ленты подписок'
+        verbose_name_plural = 'Записи лент подписок'
+
+    def __str__(self):
+        return f'{self.user.username} - {self.recipe.name}'
@@ -0,0 +1,131 @@
+from django.db import transaction
+from django.db.models.signals import (post_delete, post_init, post_save,
+                                      pre_delete, pre_save)
+from django.dispatch import receiver
+
+from users.models import Subscriptions
+
+from .images import get_backend, schedule_image_processing
+from .matching import recipe_ingredients_changed
+from .models import (Favorite, Recipe, RecipeIngredient, ShoppingList,
+                     ShoppingListIngredient, TimelineEntry)
+from .similarity import schedule_similar_recompute
+
+COUNTERS = {
+    Favorite: 'favorites_count',
+    ShoppingList: 'in_carts_count',
+}
+
+
+def refresh_shopping_list_on_commit(shopping_list):
+    user_ids = [shopping_list.user_id]
+    ingredient_ids = list(RecipeIngredient.objects.filter(
+        recipe_id=shopping_list.recipe_id
+    ).values_list('ingredient_id', flat=True))
+    transaction.on_commit(
+        lambda: ShoppingListIngredient.objects.refresh(
+            user_ids, ingredient_ids)
+    )
+
+
+@receiver(pre_save, sender=Recipe)
+def recipe_changing(sender, instance, **kwargs):
+    instance.image_changed = bool(
+        instance.image) and not instance.image._committed
+    if instance.image_changed:
+        instance.image_webp = ''
+        instance.thumbnail = ''
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved(sender, instance, created, **kwargs):
+    if getattr(instance, 'image_changed', False):
+        schedule_image_processing(instance.pk)
+    if created:
+        recipe_id, author_id = instance.pk, instance.author_id
+        transaction.on_commit(lambda: get_backend().submit(
+            TimelineEntry.objects.publish, recipe_id, author_id))
+
+
+@receiver(pre_delete, sender=Recipe)
+def recipe_deleting(sender, instance, **kwargs):
+    schedule_similar_recompute(instance.pk)
+
+
+def indexed_pair(instance):
+    return instance.__dict__.get('recipe_id'), instance.__dict__.get(
+        'ingredient_id')
+
+
+@receiver(post_init, sender=RecipeIngredient)
+def recipe_ingredient_loaded(sender, instance, **kwargs):
+    instance.indexed_pair = indexed_pair(instance)
+
+
+@receiver(post_save, sender=RecipeIngredient)
+def recipe_ingredient_saved(sender, instance, created, **kwargs):
+    pair = indexed_pair(instance)
+    if not created and pair == instance.indexed_pair:
+        return
+    if not created:
+        recipe_id, ingredient_id = instance.indexed_pair
+        recipe_ingredients_changed(recipe_id, removed=[ingredient_id])
+    recipe_ingredients_changed(instance.recipe_id, [instance.ingredient_id])
+    instance.indexed_pair = pair
+
+
+@receiver(post_delete, sender=RecipeIngredient)
+def recipe_ingredient_deleted(sender, instance, **kwargs):
+    recipe_ingredients_changed(
+        instance.recipe_id, removed=[instance.ingredient_id])
+
+
+@receiver(post_save, sender=Subscriptions)
+def subscription_saved(sender, instance, created, **kwargs):
+    if created:
+        TimelineEntry.objects.subscribed(
+            instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Subscriptions)
+def subscription_deleted(sender, instance, **kwargs):
+    TimelineEntry.objects.unsubscribed(instance.user_id, instance.author_id)
+
+
+@receiver(pre_save, sender=Favorite)
+@receiver(pre_save, sender=ShoppingList)
+def recipe_relation_changing(sender, instance, **kwargs):
+    instance.previous_state = None
+    if instance.pk is not None:
+        instance.previous_state = sender.objects.filter(
+            pk=instance.pk).first()
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingList)
+def recipe_relation_saved(sender, instance, created, **kwargs):
+    previous = getattr(instance, 'previous_state', None)
+    moved = previous is not None and previous.recipe_id != instance.recipe_id
+    counter = COUNTERS[sender]
+    if moved:
+        Recipe.objects.filter(
+            pk=previous.recipe_id).change_counter(counter, -1)
+    if created or moved:
+        Recipe.objects.filter(
+            pk=instance.recipe_id).change_counter(counter, 1)
+    if sender is ShoppingList:
+        if previous is not None:
+            refresh_shopping_list_on_commit(previous)
+        refresh_shopping_list_on_commit(instance)
+
+
+@receiver(pre_delete, sender=ShoppingList)
+def shopping_list_deleting(sender, instance, **kwargs):
+    refresh_shopping_list_on_commit(instance)
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingList)
+def recipe_relation_deleted(sender, instance, **kwargs):
+    Recipe.objects.filter(
+        pk=instance.recipe_id).change_counter(COUNTERS[sender], -1)
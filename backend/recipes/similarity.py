@@ -0,0 +1,209 @@
+import heapq
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Min, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from foodgram.versions import bump_version
+
+from .images import get_backend
+from .models import Recipe, RecipeIngredient, RecipeTag, SimilarRecipe
+
+
+class FeatureIndex:
+
+    def __init__(self):
+        ingredients = RecipeIngredient.objects.order_by().values_list(
+            'recipe_id', 'ingredient_id')
+        tags = RecipeTag.objects.order_by().values_list('recipe_id', 'tag_id')
+        rows = np.array(
+            [*ingredients, *((recipe_id, -tag) for recipe_id, tag in tags)],
+            dtype=np.int64
+        ).reshape(-1, 2)
+        self.recipe_ids, recipes = np.unique(rows[:, 0], return_inverse=True)
+        feature_ids, features = np.unique(rows[:, 1], return_inverse=True)
+        by_feature = np.lexsort((recipes, features))
+        self.postings = recipes[by_feature]
+        self.posting_bounds = np.searchsorted(
+            features[by_feature], np.arange(len(feature_ids) + 1))
+        by_recipe = np.lexsort((features, recipes))
+        self.features = features[by_recipe]
+        self.feature_bounds = np.searchsorted(
+            recipes[by_recipe], np.arange(len(self.recipe_ids) + 1))
+        self.sizes = np.diff(self.feature_bounds)
+
+    def scores(self, row):
+        features = self.features[
+            self.feature_bounds[row]:self.feature_bounds[row + 1]]
+        columns, common = np.unique(
+            np.concatenate([
+                self.postings[
+                    self.posting_bounds[feature]:
+                    self.posting_bounds[feature + 1]]
+                for feature in features
+            ]),
+            return_counts=True
+        )
+        other = columns != row
+        columns, common = columns[other], common[other]
+        return (self.recipe_ids[columns],
+                common / (self.sizes[row] + self.sizes[columns] - common))
+
+    def nearest(self, limit):
+        for row, recipe_id in enumerate(self.recipe_ids.tolist()):
+            similar_ids, scores = self.scores(row)
+            for column in np.lexsort((similar_ids, -scores))[:limit]:
+                yield SimilarRecipe(
+                    recipe_id=recipe_id,
+                    similar_id=int(similar_ids[column]),
+                    score=float(scores[column])
+                )
+
+
+def rebuild_similar():
+    index = FeatureIndex()
+    with transaction.atomic():
+        SimilarRecipe.objects.all().delete()
+        SimilarRecipe.objects.bulk_create(
+            index.nearest(settings.SIMILAR_RECIPES_LIMIT), batch_size=5000)
+    bump_version('similar')
+    return len(index.recipe_ids)
+
+
+def count_rows(queryset):
+    return Coalesce(Subquery(
+        queryset.filter(
+            recipe=OuterRef('pk')
+        ).order_by().values('recipe').annotate(
+            count=Count('id')
+        ).values('count')
+    ), 0)
+
+
+def candidate_scores(recipe_id):
+    ingredients = RecipeIngredient.objects.filter(
+        recipe_id=recipe_id).values('ingredient')
+    tags = RecipeTag.objects.filter(recipe_id=recipe_id).values('tag')
+    recipes = Recipe.objects.annotate(
+        size=count_rows(RecipeIngredient.objects) + count_rows(
+            RecipeTag.objects))
+    size = recipes.filter(id=recipe_id).values_list('size', flat=True).first()
+    candidates = recipes.filter(
+        Q(id__in=RecipeIngredient.objects.filter(
+            ingredient__in=ingredients).values('recipe'))
+        | Q(id__in=RecipeTag.objects.filter(tag__in=tags).values('recipe'))
+    ).exclude(id=recipe_id).annotate(
+        shared=count_rows(RecipeIngredient.objects.filter(
+            ingredient__in=ingredients))
+        + count_rows(RecipeTag.objects.filter(tag__in=tags))
+    ).values_list('id', 'size', 'shared')
+    return {
+        similar_id: shared / (size + similar_size - shared)
+        for similar_id, similar_size, shared in candidates
+    }
+
+
+def top_similar(scores, limit):
+    return dict(heapq.nsmallest(
+        limit,
+        ((similar_id, score) for similar_id, score in scores.items()
+         if score > 0),
+        key=lambda item: (-item[1], item[0])
+    ))
+
+
+def stored_similar(recipe_ids):
+    stored = {recipe_id: {} for recipe_id in recipe_ids}
+    for recipe_id, similar_id, score in SimilarRecipe.objects.filter(
+            recipe_id__in=recipe_ids).values_list(
+                'recipe_id', 'similar_id', 'score'):
+        stored[recipe_id][similar_id] = score
+    return stored
+
+
+def save_similar(lists):
+    with transaction.atomic():
+        SimilarRecipe.objects.filter(recipe_id__in=lists).delete()
+        SimilarRecipe.objects.bulk_create(
+            (
+                SimilarRecipe(
+                    recipe_id=recipe_id, similar_id=similar_id, score=score)
+                for recipe_id, similar in lists.items()
+                for similar_id, score in similar.items()
+            ),
+            batch_size=5000
+        )
+    for recipe_id in lists:
+        bump_version(f'similar:{recipe_id}')
+
+
+def refresh_similar(recipe_ids):
+    limit = settings.SIMILAR_RECIPES_LIMIT
+    scores = {
+        recipe_id: candidate_scores(recipe_id)
+        for recipe_id in Recipe.objects.filter(
+            id__in=recipe_ids).values_list('id', flat=True)
+    }
+    holders = set(SimilarRecipe.objects.filter(
+        similar_id__in=scores).values_list('recipe_id', flat=True))
+    offered = set()
+    for candidates in scores.values():
+        offered.update(candidates)
+    thresholds = dict(SimilarRecipe.objects.filter(
+        recipe_id__in=offered.difference(holders, scores)
+    ).values('recipe').annotate(
+        count=Count('id'), lowest=Min('score')
+    ).filter(count__gte=limit).values_list('recipe', 'lowest'))
+    targets = holders.union(
+        recipe_id for recipe_id in offered
+        if any(candidates.get(recipe_id, 0) >= thresholds.get(recipe_id, 0)
+               for candidates in scores.values())
+    ).difference(scores)
+    stored = stored_similar(targets.union(scores))
+    fresh = {
+        recipe_id: top_similar(candidates, limit)
+        for recipe_id, candidates in scores.items()
+    }
+    for recipe_id in targets:
+        similar = stored[recipe_id]
+        merged = dict(similar)
+        for changed_id, candidates in scores.items():
+            score = candidates.get(recipe_id, 0)
+            if (changed_id in similar and score < similar[changed_id]
+                    and len(similar) >= limit):
+                merged = candidate_scores(recipe_id)
+                break
+            merged[changed_id] = score
+        fresh[recipe_id] = top_similar(merged, limit)
+    lists = {
+        recipe_id: similar for recipe_id, similar in fresh.items()
+        if similar != stored[recipe_id]
+    }
+    save_similar(lists)
+    return set(lists)
+
+
+def recompute_similar(recipe_ids):
+    limit = settings.SIMILAR_RECIPES_LIMIT
+    lists = {
+        recipe_id: top_similar(candidate_scores(recipe_id), limit)
+        for recipe_id in Recipe.objects.filter(
+            id__in=recipe_ids).values_list('id', flat=True)
+    }
+    save_similar(lists)
+    return set(lists)
+
+
+def schedule_similar_refresh(*recipe_ids):
+    transaction.on_commit(
+        lambda: get_backend().submit(refresh_similar, recipe_ids))
+
+
+def schedule_similar_recompute(recipe_id):
+    holders = list(SimilarRecipe.objects.filter(
+        similar_id=recipe_id).values_list('recipe_id', flat=True))
+    if holders:
+        transaction.on_commit(
+            lambda: get_backend().submit(recompute_similar, holders))
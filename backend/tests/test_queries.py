@@ -0,0 +1,70 @@
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
+from users.models import User
+
+DUMMY_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+}
+PAGE_SIZE = 6
+INGREDIENTS_COUNT = 10
+
+
+@override_settings(CACHES=DUMMY_CACHES)
+class RecipeQueriesTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            username='author', email='author@foodgram.ru')
+        cls.tag = Tag.objects.create(
+            name='Завтрак', slug='breakfast', color='#E26C2D')
+        cls.ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'Ингредиент {i}', measurement_unit='г')
+            for i in range(INGREDIENTS_COUNT)
+        )
+        cls.recipe = cls.create_recipe(0)
+
+    @classmethod
+    def create_recipe(cls, index):
+        recipe = Recipe.objects.create(
+            author=cls.user,
+            name=f'Рецепт {index}',
+            image='recipes/recipe.png',
+            text='Описание',
+            cooking_time=1
+        )
+        recipe.tags.set([cls.tag])
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, ingredient=ingredient, amount=1)
+            for ingredient in Ingredient.objects.all()
+        )
+        return recipe
+
+    def assert_queries(self, url, queries, authenticated):
+        client = APIClient()
+        if authenticated:
+            client.force_authenticate(self.user)
+        with self.assertNumQueries(queries):
+            response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        for index in range(1, PAGE_SIZE):
+            self.create_recipe(index)
+        with self.assertNumQueries(queries):
+            response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+    def test_list_anonymous(self):
+        self.assert_queries('/api/recipes/', 4, authenticated=False)
+
+    def test_list_authenticated(self):
+        self.assert_queries('/api/recipes/', 7, authenticated=True)
+
+    def test_detail_anonymous(self):
+        self.assert_queries(
+            f'/api/recipes/{self.recipe.id}/', 3, authenticated=False)
+
+    def test_detail_authenticated(self):
+        self.assert_queries(
+            f'/api/recipes/{self.recipe.id}/', 6, authenticated=True)